@@ -0,0 +1,240 @@
+import argparse
+import json
+import time
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+from typing import List
+
+from Crawler import ScheduleCrawler
+from FakeApiServer import FakeApiServer, FakeApiData
+from ParserCal import GoogleCalendarParser
+from ParserSched import SchedulerParser
+from RateLimiter import AdaptiveRateLimiter
+from main import DatabaseManager
+from Migrations import MigrationManager
+from Metrics import metrics
+
+
+# Схема таблиц для локальной PostgreSQL (как в CloudDatabaseScheme.txt, без RLS)
+BENCHMARK_SCHEMA = """
+CREATE TABLE IF NOT EXISTS faculties (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    abbr VARCHAR(50)
+);
+
+CREATE TABLE IF NOT EXISTS groups (
+    id SERIAL PRIMARY KEY,
+    faculty_id INTEGER REFERENCES faculties(id),
+    name VARCHAR(100) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS schedule (
+    id SERIAL PRIMARY KEY,
+    group_id INTEGER REFERENCES groups(id),
+    date DATE,
+    weekday INTEGER CHECK (weekday BETWEEN 1 AND 6),
+    subject VARCHAR(255) NOT NULL,
+    type VARCHAR(50),
+    start_time TIME,
+    end_time TIME,
+    teacher VARCHAR(255),
+    audithory VARCHAR(50)
+);
+
+CREATE TABLE IF NOT EXISTS calendar_events (
+    id SERIAL PRIMARY KEY,
+    title VARCHAR(255) NOT NULL,
+    description TEXT,
+    date DATE NOT NULL,
+    start_time TIME,
+    end_time TIME,
+    location VARCHAR(255),
+    creator VARCHAR(255),
+    calendar_name VARCHAR(100)
+);
+"""
+
+
+@dataclass
+class StageResult:
+    name: str
+    wall_time: float
+    requests: int
+    rows: int
+
+    @property
+    def requests_per_second(self) -> float:
+        return self.requests / self.wall_time if self.wall_time else 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.wall_time if self.wall_time else 0.0
+
+
+class Benchmark:
+    """
+    Замеряет весь конвейер синхронизации на локальном имитаторе RUZ и Google Calendar
+    и, если указана база, на локальной PostgreSQL
+    """
+
+    def __init__(self, server: FakeApiServer, groups: int, weeks: int, workers: int,
+                 rps: float, dsn: str = None):
+        self.server = server
+        self.groups = groups
+        self.weeks = weeks
+        self.workers = workers
+        self.rps = rps
+        self.dsn = dsn
+        self.results: List[StageResult] = []
+
+    def __stage(self, name: str, func):
+        """Выполняет этап и записывает время, число запросов к серверу и число строк"""
+        requests_before = self.server.request_count
+        started_at = time.perf_counter()
+        value, rows = func()
+        wall_time = time.perf_counter() - started_at
+
+        result = StageResult(name, wall_time, self.server.request_count - requests_before, rows)
+        self.results.append(result)
+        print(f"{name}: {wall_time:.2f} с, {result.requests_per_second:.1f} запросов/с, "
+              f"{result.rows_per_second:.1f} строк/с")
+        return value
+
+    def run(self) -> List[StageResult]:
+        scheduler_parser = SchedulerParser(rate_limiter=AdaptiveRateLimiter(rate=self.rps, max_rate=self.rps))
+        scheduler_parser.BASE_URL = self.server.ruz_url
+        calendar_parser = GoogleCalendarParser()
+        calendar_parser.BASE_URL = self.server.calendar_url
+
+        def fetch_groups():
+            groups = []
+            for faculty in scheduler_parser.get_faculties():
+                groups.extend(scheduler_parser.get_groups_by_faculty(faculty.id))
+            return groups, len(groups)
+
+        groups = self.__stage('ruz_groups', fetch_groups)
+        group_ids = [group.id for group in groups][:self.groups]
+
+        def fetch_schedules():
+            schedules = []
+            ScheduleCrawler(scheduler_parser, max_workers=self.workers).crawl(
+                group_ids,
+                start_date=datetime.now().strftime('%Y-%m-%d'),
+                max_weeks=self.weeks,
+                on_result=lambda i, result: schedules.append(result)
+            )
+            lessons = sum(
+                len(day.lessons)
+                for result in schedules if result.semester_schedule
+                for week in result.semester_schedule.weeks
+                for day in week.days
+            )
+            return schedules, lessons
+
+        schedules = self.__stage('ruz_schedules', fetch_schedules)
+
+        today = datetime.now()
+        time_min = today.replace(day=1).strftime('%Y-%m-%dT00:00:00Z')
+        time_max = (today.replace(day=1) + timedelta(days=31)).strftime('%Y-%m-%dT23:59:59Z')
+
+        def fetch_events():
+            events = calendar_parser.getAllEvents(time_min, time_max)
+            return events, len(events)
+
+        events = self.__stage('calendar_events', fetch_events)
+
+        if self.dsn:
+            self.__run_db_stages(scheduler_parser, schedules, events)
+
+        return self.results
+
+    def __run_db_stages(self, scheduler_parser, schedules, events):
+        db_manager = DatabaseManager(db_config={'dsn': self.dsn}, sslmode='prefer')
+        if not db_manager.connect():
+            return
+
+        try:
+            with db_manager.get_connection() as connection, connection.cursor() as cursor:
+                cursor.execute(BENCHMARK_SCHEMA)
+                connection.commit()
+            MigrationManager(db_manager).migrate()
+
+            # Каждый прогон пишет в пустые таблицы, иначе хеши недель пропустят запись
+            with db_manager.get_connection() as connection, connection.cursor() as cursor:
+                cursor.execute("""
+                    TRUNCATE schedule_week_fingerprints, schedule, calendar_events, groups, faculties
+                    RESTART IDENTITY CASCADE
+                """)
+                connection.commit()
+
+            def write_groups():
+                groups = db_manager.insert_faculties_and_groups(scheduler_parser)
+                return groups, len(groups)
+
+            self.__stage('db_groups', write_groups)
+
+            def write_schedules():
+                rows = 0
+                for result in schedules:
+                    if result.semester_schedule and result.semester_schedule.weeks:
+                        rows += db_manager.insert_semester_schedule(result.semester_schedule, result.group_id) or 0
+                return None, rows
+
+            self.__stage('db_schedule', write_schedules)
+
+            def write_events():
+                db_manager.insert_calendar_events(events)
+                return None, len(events)
+
+            self.__stage('db_calendar_events', write_events)
+        finally:
+            db_manager.disconnect()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Офлайн-бенчмарк синхронизации на локальном имитаторе API")
+    arg_parser.add_argument('--faculties', type=int, default=5)
+    arg_parser.add_argument('--groups-per-faculty', type=int, default=20)
+    arg_parser.add_argument('--groups', type=int, default=50, help="сколько групп обходить")
+    arg_parser.add_argument('--weeks', type=int, default=6)
+    arg_parser.add_argument('--workers', type=int, default=8)
+    arg_parser.add_argument('--rps', type=float, default=200.0, help="ограничение запросов в секунду")
+    arg_parser.add_argument('--latency', type=float, default=0.05, help="задержка ответа сервера, с")
+    arg_parser.add_argument('--error-rate', type=float, default=0.0, help="доля ответов 503")
+    arg_parser.add_argument('--dsn', help="строка подключения к локальной PostgreSQL для замера записи")
+    arg_parser.add_argument('--output', help="файл для JSON-отчета")
+    args = arg_parser.parse_args()
+
+    data = FakeApiData(faculties=args.faculties, groups_per_faculty=args.groups_per_faculty)
+    server = FakeApiServer(data, latency=args.latency, error_rate=args.error_rate).start()
+
+    started_at = time.perf_counter()
+    try:
+        results = Benchmark(server, groups=args.groups, weeks=args.weeks, workers=args.workers,
+                            rps=args.rps, dsn=args.dsn).run()
+    finally:
+        server.stop()
+    wall_time = time.perf_counter() - started_at
+
+    print(f"\nВсего: {wall_time:.2f} с, запросов к серверу: {server.request_count}, ошибок 503: {server.error_count}")
+
+    if args.output:
+        report = {
+            'wall_time': wall_time,
+            'requests': server.request_count,
+            'errors': server.error_count,
+            'stages': [
+                {**asdict(result),
+                 'requests_per_second': result.requests_per_second,
+                 'rows_per_second': result.rows_per_second}
+                for result in results
+            ],
+            'metrics': metrics.to_summary(),
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
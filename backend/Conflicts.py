@@ -0,0 +1,150 @@
+from collections import defaultdict
+from datetime import time
+from typing import List, Tuple, Dict, Iterator
+
+from psycopg2.extras import execute_values
+
+from Metrics import metrics
+
+
+# Интервал: (начало, конец, id)
+Interval = Tuple[time, time, int]
+
+# События на весь день (00:00-23:59) не считаются пересечением с занятиями
+ALL_DAY = (time(0, 0), time(23, 59))
+
+
+def find_overlaps(lessons: List[Interval], events: List[Interval]) -> Iterator[Tuple[int, int, time, time]]:
+    """
+    Пересечения занятий с событиями одного дня методом заметающей прямой.
+    Оба списка сортируются по началу; событие остается активным, пока не закончится
+    до начала очередного занятия. Выдает (lesson_id, event_id, начало, конец пересечения)
+    """
+    lessons = sorted(lessons)
+    events = sorted(events)
+    active: List[Interval] = []
+    next_event = 0
+
+    for lesson_start, lesson_end, lesson_id in lessons:
+        # Добавляем события, начавшиеся до конца занятия
+        while next_event < len(events) and events[next_event][0] < lesson_end:
+            active.append(events[next_event])
+            next_event += 1
+
+        # Событие, закончившееся до начала занятия, не пересечет и следующие занятия
+        active = [event for event in active if event[1] > lesson_start]
+
+        for event_start, event_end, event_id in active:
+            if event_start < lesson_end:
+                yield lesson_id, event_id, max(lesson_start, event_start), min(lesson_end, event_end)
+
+
+class ConflictEngine:
+    """
+    Поддерживает таблицу schedule_conflicts. Запись расписания и изменения
+    календаря ставят затронутые дни в conflict_dirty_days, refresh() пересчитывает
+    только эти дни. Удаленные занятия и события убираются каскадом
+    """
+
+    def __init__(self, db_manager, batch_days: int = 200):
+        self.db_manager = db_manager
+        self.batch_days = batch_days
+
+    def refresh(self) -> int:
+        """Пересчитывает все дни из очереди, возвращает число найденных пересечений"""
+        total = 0
+        while True:
+            with metrics.timer('conflict_refresh_seconds'):
+                processed, found = self.__refresh_batch()
+            total += found
+            if processed < self.batch_days:
+                break
+
+        print(f"Пересечений занятий с событиями пересчитано: {total}")
+        return total
+
+    def __refresh_batch(self) -> Tuple[int, int]:
+        with self.db_manager.get_connection() as connection, connection.cursor() as cursor:
+            # Дни забираются из очереди в той же транзакции, что и пересчет:
+            # при ошибке они вернутся в очередь
+            cursor.execute("""
+                DELETE FROM conflict_dirty_days
+                WHERE (group_id, date) IN (
+                    SELECT group_id, date FROM conflict_dirty_days
+                    ORDER BY date
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING group_id, date
+            """, (self.batch_days,))
+            dirty_days = cursor.fetchall()
+            if not dirty_days:
+                connection.commit()
+                return 0, 0
+
+            all_group_dates = sorted({day for group_id, day in dirty_days if group_id == 0})
+            group_days = [(group_id, day) for group_id, day in dirty_days if group_id != 0]
+
+            # Занятия затронутых дней
+            lessons: Dict[Tuple[int, object], List[Interval]] = defaultdict(list)
+            seen_lessons = set()
+            queries = []
+            if all_group_dates:
+                queries.append(("""
+                    SELECT id, group_id, date, start_time, end_time FROM schedule
+                    WHERE date = ANY(%s::date[])
+                """, (all_group_dates,)))
+            if group_days:
+                queries.append(("""
+                    SELECT s.id, s.group_id, s.date, s.start_time, s.end_time
+                    FROM unnest(%s::int[], %s::date[]) AS d(group_id, date)
+                    JOIN schedule s ON s.group_id = d.group_id AND s.date = d.date
+                """, ([group_id for group_id, _ in group_days], [day for _, day in group_days])))
+            for query, params in queries:
+                cursor.execute(query, params)
+                for lesson_id, group_id, day, start_time, end_time in cursor.fetchall():
+                    if lesson_id in seen_lessons or start_time is None or end_time is None:
+                        continue
+                    seen_lessons.add(lesson_id)
+                    lessons[(group_id, day)].append((start_time, end_time, lesson_id))
+
+            # События тех же дней
+            events: Dict[object, List[Interval]] = defaultdict(list)
+            days = sorted({day for _, day in dirty_days})
+            cursor.execute("""
+                SELECT id, date, start_time, end_time FROM calendar_events
+                WHERE date = ANY(%s::date[]) AND start_time IS NOT NULL AND end_time IS NOT NULL
+            """, (days,))
+            for event_id, day, start_time, end_time in cursor.fetchall():
+                if (start_time, end_time) != ALL_DAY:
+                    events[day].append((start_time, end_time, event_id))
+
+            conflicts = [
+                (lesson_id, event_id, group_id, day, overlap_start, overlap_end)
+                for (group_id, day), day_lessons in lessons.items()
+                if events.get(day)
+                for lesson_id, event_id, overlap_start, overlap_end in find_overlaps(day_lessons, events[day])
+            ]
+
+            # Старые пересечения затронутых дней заменяются новыми
+            if all_group_dates:
+                cursor.execute("DELETE FROM schedule_conflicts WHERE date = ANY(%s::date[])", (all_group_dates,))
+            if group_days:
+                cursor.execute("""
+                    DELETE FROM schedule_conflicts c
+                    USING unnest(%s::int[], %s::date[]) AS d(group_id, date)
+                    WHERE c.group_id = d.group_id AND c.date = d.date
+                """, ([group_id for group_id, _ in group_days], [day for _, day in group_days]))
+            if conflicts:
+                execute_values(cursor, """
+                    INSERT INTO schedule_conflicts (lesson_id, event_id, group_id, date, overlap_start, overlap_end)
+                    VALUES %s
+                    ON CONFLICT (lesson_id, event_id) DO UPDATE SET
+                        overlap_start = EXCLUDED.overlap_start,
+                        overlap_end = EXCLUDED.overlap_end
+                """, conflicts, page_size=1000)
+
+            connection.commit()
+
+        metrics.inc('conflict_days_refreshed_total', len(dirty_days))
+        return len(dirty_days), len(conflicts)
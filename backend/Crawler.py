@@ -0,0 +1,94 @@
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Iterable, Optional, Callable
+
+from ParserSched import SchedulerParser, SemesterSchedule
+
+
+@dataclass
+class CrawlResult:
+    group_id: int
+    semester_schedule: Optional[SemesterSchedule]
+    error: Optional[Exception] = None
+
+
+class ScheduleCrawler:
+    """
+    Параллельный обход расписаний групп с ограниченным числом потоков.
+    Частота запросов ограничивается общим AdaptiveRateLimiter внутри SchedulerParser.
+    Результаты передаются записи через ограниченную очередь: если запись отстает,
+    потоки загрузки ждут, поэтому в памяти не больше queue_size расписаний
+    """
+
+    # Признак того, что поток загрузки закончил работу
+    __WORKER_DONE = object()
+
+    def __init__(self, scheduler_parser: SchedulerParser, max_workers: int = 8, parallel_weeks: bool = True):
+        self.scheduler_parser = scheduler_parser
+        self.max_workers = max_workers
+        # Недели одной группы запрашиваются одновременно, а не друг за другом
+        self.parallel_weeks = parallel_weeks
+        # Потоки недель делят пул соединений сессии: всего одновременных запросов
+        # max_workers * week_workers не больше pool_maxsize
+        self.week_workers = max(1, scheduler_parser.pool_maxsize // max_workers)
+
+    def __fetch_group(self, group_id: int, start_date: str, max_weeks: int) -> CrawlResult:
+        try:
+            semester_schedule = self.scheduler_parser.get_semester_schedule(
+                group_id=group_id,
+                start_date=start_date,
+                max_weeks=max_weeks,
+                parallel=self.parallel_weeks,
+                week_workers=self.week_workers
+            )
+            return CrawlResult(group_id=group_id, semester_schedule=semester_schedule)
+        except Exception as e:
+            return CrawlResult(group_id=group_id, semester_schedule=None, error=e)
+
+    def crawl(self, group_ids: Iterable[int], start_date: str, max_weeks: int,
+              on_result: Callable[[int, CrawlResult], None], queue_size: int = None):
+        """
+        Получает расписания групп параллельно. on_result вызывается в текущем потоке
+        по мере готовности результатов (номер по порядку завершения, результат),
+        так что запись в БД идет одновременно с загрузкой следующих групп
+        """
+        results = queue.Queue(maxsize=queue_size or self.max_workers * 2)
+        group_iter = iter(group_ids)
+        group_lock = threading.Lock()
+        stop = threading.Event()
+
+        def worker():
+            try:
+                while not stop.is_set():
+                    with group_lock:
+                        group_id = next(group_iter, None)
+                    if group_id is None:
+                        return
+                    # Блокируется, пока запись не освободит место в очереди
+                    results.put(self.__fetch_group(group_id, start_date, max_weeks))
+            finally:
+                results.put(self.__WORKER_DONE)
+
+        workers = [threading.Thread(target=worker, daemon=True) for _ in range(self.max_workers)]
+        for thread in workers:
+            thread.start()
+
+        finished = 0
+        try:
+            i = 0
+            while finished < len(workers):
+                result = results.get()
+                if result is self.__WORKER_DONE:
+                    finished += 1
+                    continue
+                i += 1
+                on_result(i, result)
+        finally:
+            # При ошибке записи останавливаем загрузку и освобождаем ждущие потоки
+            stop.set()
+            while finished < len(workers):
+                if results.get() is self.__WORKER_DONE:
+                    finished += 1
+            for thread in workers:
+                thread.join()
@@ -0,0 +1,199 @@
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, List
+from urllib.parse import urlparse, parse_qs, unquote
+
+
+class FakeApiData:
+    """
+    Синтетические данные RUZ и Google Calendar: факультеты, группы,
+    недельные расписания и события календарей
+    """
+
+    SUBJECTS = ["Математический анализ", "Физика", "Программирование", "Иностранный язык",
+                "Алгебра и геометрия", "История", "Базы данных", "Физическая культура"]
+    TYPES = ["Лекции", "Практика", "Лабораторные"]
+    TIMES = [("08:00", "09:40"), ("10:00", "11:40"), ("12:00", "13:40"), ("14:00", "15:40"), ("16:00", "17:40")]
+
+    def __init__(self, faculties: int = 5, groups_per_faculty: int = 20,
+                 lessons_per_day: int = 4, events_per_calendar: int = 60, seed: int = 42):
+        self.faculties = faculties
+        self.groups_per_faculty = groups_per_faculty
+        self.lessons_per_day = lessons_per_day
+        self.events_per_calendar = events_per_calendar
+        self.seed = seed
+
+    def faculties_payload(self) -> Dict[str, Any]:
+        return {'faculties': [
+            {'id': faculty_id, 'name': f"Институт {faculty_id}", 'abbr': f"И{faculty_id}"}
+            for faculty_id in range(1, self.faculties + 1)
+        ]}
+
+    def groups_payload(self, faculty_id: int) -> Dict[str, Any]:
+        first_id = faculty_id * 1000
+        return {'groups': [
+            {'id': group_id, 'name': f"{faculty_id}{group_id % 1000:04d}/1"}
+            for group_id in range(first_id + 1, first_id + self.groups_per_faculty + 1)
+        ]}
+
+    def schedule_payload(self, group_id: int, date: str) -> Dict[str, Any]:
+        day = datetime.strptime(date, '%Y-%m-%d') if date else datetime.now()
+        monday = day - timedelta(days=day.weekday())
+        rng = random.Random(f"{self.seed}:{group_id}:{monday:%Y-%m-%d}")
+        group = {'id': group_id, 'name': f"группа {group_id}"}
+
+        days = []
+        for weekday in range(1, 7):
+            lessons = []
+            for time_start, time_end in rng.sample(self.TIMES, min(self.lessons_per_day, len(self.TIMES))):
+                lessons.append({
+                    'subject': rng.choice(self.SUBJECTS),
+                    'time_start': time_start,
+                    'time_end': time_end,
+                    'typeObj': {'name': rng.choice(self.TYPES)},
+                    'teachers': [{'full_name': f"Преподаватель {rng.randint(1, 300)}"}],
+                    'groups': [group],
+                    'auditories': [{'name': str(rng.randint(100, 500)),
+                                    'building': {'abbr': f"Корпус {rng.randint(1, 12)}"}}],
+                })
+            days.append({
+                'weekday': weekday,
+                'date': (monday + timedelta(days=weekday - 1)).strftime('%Y-%m-%d'),
+                'lessons': lessons,
+            })
+
+        return {
+            'week': {
+                'date_start': monday.strftime('%Y.%m.%d'),
+                'date_end': (monday + timedelta(days=6)).strftime('%Y.%m.%d'),
+                'is_odd': monday.isocalendar()[1] % 2 == 1,
+            },
+            'days': days,
+            'group': group,
+        }
+
+    def calendar_items(self, calendar_id: str) -> List[Dict[str, Any]]:
+        rng = random.Random(f"{self.seed}:{calendar_id}")
+        month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+        items = []
+        for n in range(self.events_per_calendar):
+            start = month_start + timedelta(days=rng.randint(0, 27), hours=rng.randint(9, 20))
+            item = {
+                'id': f"event{n}",
+                'status': 'confirmed',
+                'summary': f"Событие {n}",
+                'description': "Описание события",
+                'location': f"Аудитория {rng.randint(100, 500)}",
+                'creator': {'email': 'organizer@example.com'},
+            }
+            if n % 10 == 0:
+                item['start'] = {'date': start.strftime('%Y-%m-%d')}
+                item['end'] = {'date': (start + timedelta(days=1)).strftime('%Y-%m-%d')}
+            else:
+                item['start'] = {'dateTime': start.strftime('%Y-%m-%dT%H:%M:%S+03:00')}
+                item['end'] = {'dateTime': (start + timedelta(hours=2)).strftime('%Y-%m-%dT%H:%M:%S+03:00')}
+            items.append(item)
+        return items
+
+
+class FakeApiServer:
+    """
+    Локальный HTTP-сервер, имитирующий RUZ (/ruz/...) и Google Calendar (/calendar/...)
+    с настраиваемой задержкой и долей ошибок 503
+    """
+
+    def __init__(self, data: FakeApiData = None, latency: float = 0.05,
+                 error_rate: float = 0.0, page_size: int = 50, port: int = 0):
+        self.data = data or FakeApiData()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.page_size = page_size
+        self.request_count = 0
+        self.error_count = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self.__make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def ruz_url(self) -> str:
+        return f"{self.base_url}/ruz/"
+
+    @property
+    def calendar_url(self) -> str:
+        return f"{self.base_url}/calendar/"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def route(self, path: str, query: Dict[str, str]) -> Dict[str, Any]:
+        parts = [unquote(part) for part in path.strip('/').split('/')]
+
+        if parts[:1] == ['ruz'] and parts[1:] == ['faculties']:
+            return self.data.faculties_payload()
+        if parts[:2] == ['ruz', 'faculties'] and len(parts) == 4 and parts[3] == 'groups':
+            return self.data.groups_payload(int(parts[2]))
+        if parts[:2] == ['ruz', 'scheduler'] and len(parts) == 3:
+            return self.data.schedule_payload(int(parts[2]), query.get('date', ''))
+        if parts[:1] == ['calendar'] and len(parts) == 3 and parts[2] == 'events':
+            items = self.data.calendar_items(parts[1])
+            offset = int(query.get('pageToken', 0))
+            payload = {'items': items[offset:offset + self.page_size]}
+            if offset + self.page_size < len(items):
+                payload['nextPageToken'] = str(offset + self.page_size)
+            else:
+                payload['nextSyncToken'] = f"sync-{len(items)}"
+            return payload
+        return None
+
+    def __make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server.lock:
+                    server.request_count += 1
+
+                if server.latency:
+                    time.sleep(server.latency)
+
+                if server.error_rate and random.random() < server.error_rate:
+                    with server.lock:
+                        server.error_count += 1
+                    self.send_error(503)
+                    return
+
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                payload = server.route(url.path, query)
+                if payload is None:
+                    self.send_error(404)
+                    return
+
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,21 @@
+import json
+from typing import Any
+
+# orjson разбирает JSON в несколько раз быстрее стандартного модуля.
+# Если пакет не установлен, используется json из стандартной библиотеки
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(content) -> Any:
+    """Разбирает JSON из bytes или str"""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def decode_response(response) -> Any:
+    """Разбирает тело ответа requests, не создавая промежуточную строку"""
+    return loads(response.content)
@@ -0,0 +1,145 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Tuple, List, Any
+
+
+# Границы корзин гистограмм длительности, секунды
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля по верхним границам корзин"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float('inf')
+        return float('inf')
+
+
+class Metrics:
+    """
+    Счетчики и гистограммы длительностей с метками. Потокобезопасно,
+    выгружается в текстовый формат Prometheus или JSON-сводку
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[Tuple[str, Tuple], float] = {}
+        self.histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+        self.started_at = time.time()
+
+    @staticmethod
+    def __key(name: str, labels: Dict[str, Any]) -> Tuple[str, Tuple]:
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self.__key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = self.__key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Замеряет длительность блока в гистограмму name"""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started_at, **labels)
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+            self.started_at = time.time()
+
+    @staticmethod
+    def __format_labels(labels: Tuple, extra: Tuple = ()) -> str:
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        escaped = [(key, value.replace('\\', '\\\\').replace('"', '\\"')) for key, value in pairs]
+        return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+    def to_prometheus(self) -> str:
+        lines: List[str] = []
+        with self.lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (counter_name, labels), value in sorted(self.counters.items()):
+                    if counter_name == name:
+                        lines.append(f"{name}{self.__format_labels(labels)} {value}")
+
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (histogram_name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if histogram_name != name:
+                        continue
+                    cumulative = 0
+                    for bucket, bucket_count in zip(histogram.buckets, histogram.counts):
+                        cumulative += bucket_count
+                        lines.append(f"{name}_bucket{self.__format_labels(labels, (('le', str(bucket)),))} {cumulative}")
+                    lines.append(f"{name}_bucket{self.__format_labels(labels, (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{name}_sum{self.__format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{self.__format_labels(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def to_summary(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'wall_time': time.time() - self.started_at,
+                'counters': [
+                    {'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                'histograms': [
+                    {
+                        'name': name,
+                        'labels': dict(labels),
+                        'count': histogram.count,
+                        'sum': histogram.sum,
+                        'avg': histogram.sum / histogram.count if histogram.count else 0.0,
+                        'p50': histogram.quantile(0.5),
+                        'p95': histogram.quantile(0.95),
+                    }
+                    for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0])
+                ],
+            }
+
+    def write_prometheus(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+
+    def write_json(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_summary(), f, ensure_ascii=False, indent=2)
+
+
+# Общий реестр метрик процесса
+metrics = Metrics()
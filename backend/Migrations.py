@@ -0,0 +1,299 @@
+from typing import List, Tuple
+
+
+# Миграции схемы: (версия, описание, SQL). Каждая применяется один раз,
+# примененные версии записываются в schema_migrations
+MIGRATIONS: List[Tuple[int, str, str]] = [
+    (1, "Поле place в таблице schedule", """
+        ALTER TABLE schedule ADD COLUMN IF NOT EXISTS place VARCHAR(100);
+    """),
+    (2, "Поле event_id в таблице calendar_events", """
+        ALTER TABLE calendar_events ADD COLUMN IF NOT EXISTS event_id VARCHAR(255);
+        CREATE INDEX IF NOT EXISTS idx_calendar_events_event_id
+        ON calendar_events (calendar_name, event_id);
+    """),
+    (3, "Таблица хешей недель расписания", """
+        CREATE TABLE IF NOT EXISTS schedule_week_fingerprints (
+            group_id INTEGER REFERENCES groups(id),
+            week_start DATE NOT NULL,
+            fingerprint CHAR(64) NOT NULL,
+            updated_at TIMESTAMP DEFAULT NOW(),
+            PRIMARY KEY (group_id, week_start)
+        );
+    """),
+    (4, "Очистка дубликатов и уникальное ограничение calendar_events", """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'unique_calendar_event') THEN
+                DELETE FROM calendar_events
+                WHERE id IN (
+                    SELECT id FROM (
+                        SELECT id, ROW_NUMBER() OVER (
+                            PARTITION BY title, date, start_time, end_time, calendar_name
+                            ORDER BY id
+                        ) as rn
+                        FROM calendar_events
+                    ) t
+                    WHERE t.rn > 1
+                );
+                ALTER TABLE calendar_events
+                ADD CONSTRAINT unique_calendar_event
+                UNIQUE (title, date, start_time, end_time, calendar_name);
+            END IF;
+        END $$;
+    """),
+    (5, "Очистка дубликатов и уникальное ограничение schedule", """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'unique_schedule_lesson') THEN
+                DELETE FROM schedule
+                WHERE id IN (
+                    SELECT id FROM (
+                        SELECT id, ROW_NUMBER() OVER (
+                            PARTITION BY group_id, date, start_time, end_time, subject
+                            ORDER BY id
+                        ) as rn
+                        FROM schedule
+                    ) t
+                    WHERE t.rn > 1
+                );
+                ALTER TABLE schedule
+                ADD CONSTRAINT unique_schedule_lesson
+                UNIQUE (group_id, date, start_time, end_time, subject);
+            END IF;
+        END $$;
+    """),
+    (6, "Индекс событий календаря по дате", """
+        CREATE INDEX IF NOT EXISTS idx_calendar_events_date ON calendar_events (date);
+    """),
+    (7, "Очередь аренды групп для параллельной загрузки", """
+        CREATE TABLE IF NOT EXISTS group_sync_leases (
+            group_id INTEGER PRIMARY KEY REFERENCES groups(id),
+            status VARCHAR(16) NOT NULL DEFAULT 'pending',
+            worker VARCHAR(255),
+            lease_until TIMESTAMP,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            updated_at TIMESTAMP DEFAULT NOW()
+        );
+        CREATE INDEX IF NOT EXISTS idx_group_sync_leases_status ON group_sync_leases (status, group_id);
+    """),
+    (8, "Журнал изменений недель, спрос и состояние обновления групп", """
+        CREATE TABLE IF NOT EXISTS schedule_week_changes (
+            id BIGSERIAL PRIMARY KEY,
+            group_id INTEGER REFERENCES groups(id),
+            week_start DATE NOT NULL,
+            changed_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+        CREATE INDEX IF NOT EXISTS idx_schedule_week_changes_changed_at
+        ON schedule_week_changes (changed_at, group_id);
+
+        CREATE TABLE IF NOT EXISTS group_demand (
+            group_id INTEGER PRIMARY KEY REFERENCES groups(id),
+            views INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT NOW()
+        );
+
+        CREATE TABLE IF NOT EXISTS group_refresh_state (
+            group_id INTEGER PRIMARY KEY REFERENCES groups(id),
+            tier VARCHAR(16),
+            score REAL,
+            last_refreshed_at TIMESTAMP
+        );
+    """),
+    (9, "Снимки недель расписания и месяцев календаря для чтения", """
+        CREATE TABLE IF NOT EXISTS schedule_snapshots (
+            group_id INTEGER REFERENCES groups(id),
+            week_start DATE NOT NULL,
+            payload TEXT NOT NULL,
+            etag CHAR(64) NOT NULL,
+            fingerprint CHAR(64),
+            updated_at TIMESTAMP DEFAULT NOW(),
+            PRIMARY KEY (group_id, week_start)
+        );
+
+        CREATE TABLE IF NOT EXISTS calendar_month_snapshots (
+            calendar_name VARCHAR(100) NOT NULL,
+            month DATE NOT NULL,
+            payload TEXT NOT NULL,
+            etag CHAR(64) NOT NULL,
+            updated_at TIMESTAMP DEFAULT NOW(),
+            PRIMARY KEY (calendar_name, month)
+        );
+    """),
+    (10, "Справочники преподавателей и аудиторий, индексы занятости", """
+        CREATE TABLE IF NOT EXISTS teachers (
+            id SERIAL PRIMARY KEY,
+            full_name VARCHAR(255) NOT NULL UNIQUE
+        );
+
+        CREATE TABLE IF NOT EXISTS rooms (
+            id SERIAL PRIMARY KEY,
+            building VARCHAR(100) NOT NULL DEFAULT '',
+            name VARCHAR(50) NOT NULL,
+            UNIQUE (building, name)
+        );
+
+        ALTER TABLE schedule ADD COLUMN IF NOT EXISTS teacher_id INTEGER REFERENCES teachers(id);
+        ALTER TABLE schedule ADD COLUMN IF NOT EXISTS room_id INTEGER REFERENCES rooms(id);
+
+        -- Занятия преподавателя или аудитории за день - один диапазон индекса
+        CREATE INDEX IF NOT EXISTS idx_schedule_teacher_interval
+        ON schedule (teacher_id, date, start_time, end_time) WHERE teacher_id IS NOT NULL;
+        CREATE INDEX IF NOT EXISTS idx_schedule_room_interval
+        ON schedule (room_id, date, start_time, end_time) WHERE room_id IS NOT NULL;
+
+        -- Заполнение справочников по уже загруженному расписанию
+        INSERT INTO teachers (full_name)
+        SELECT DISTINCT teacher FROM schedule WHERE teacher <> ''
+        ON CONFLICT (full_name) DO NOTHING;
+
+        INSERT INTO rooms (building, name)
+        SELECT DISTINCT COALESCE(place, ''), audithory FROM schedule WHERE audithory <> ''
+        ON CONFLICT (building, name) DO NOTHING;
+
+        UPDATE schedule s SET teacher_id = t.id
+        FROM teachers t WHERE t.full_name = s.teacher;
+
+        UPDATE schedule s SET room_id = r.id
+        FROM rooms r WHERE r.building = COALESCE(s.place, '') AND r.name = s.audithory;
+    """),
+    (11, "Полнотекстовый и нечеткий поиск по событиям и занятиям", """
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+        ALTER TABLE calendar_events ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('russian', COALESCE(title, '')), 'A') ||
+            setweight(to_tsvector('russian', COALESCE(description, '')), 'B') ||
+            setweight(to_tsvector('russian', COALESCE(location, '')), 'C')
+        ) STORED;
+
+        CREATE INDEX IF NOT EXISTS idx_calendar_events_search ON calendar_events USING gin (search_vector);
+        CREATE INDEX IF NOT EXISTS idx_calendar_events_title_trgm ON calendar_events USING gin (title gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS idx_schedule_subject_search ON schedule USING gin (to_tsvector('russian', subject));
+        CREATE INDEX IF NOT EXISTS idx_schedule_subject_trgm ON schedule USING gin (subject gin_trgm_ops);
+
+        -- Поиск с ранжированием: совпадения по словам с учетом морфологии
+        -- плюс похожесть по триграммам для запросов с опечатками
+        CREATE OR REPLACE FUNCTION search_planner(p_query TEXT, p_group_id INTEGER DEFAULT NULL,
+                                                  p_limit INTEGER DEFAULT 20)
+        RETURNS TABLE (kind TEXT, id INTEGER, title TEXT, date DATE, start_time TIME, rank REAL)
+        LANGUAGE sql STABLE AS $fn$
+            WITH q AS (SELECT websearch_to_tsquery('russian', p_query) AS tsq)
+            SELECT * FROM (
+                (SELECT 'event'::text, e.id, e.title::text, e.date, e.start_time,
+                        (ts_rank(e.search_vector, q.tsq) + similarity(e.title, p_query))::real AS rank
+                 FROM calendar_events e, q
+                 WHERE e.search_vector @@ q.tsq OR e.title % p_query
+                 ORDER BY rank DESC
+                 LIMIT p_limit)
+                UNION ALL
+                (SELECT 'lesson'::text, s.id, s.subject::text, s.date, s.start_time,
+                        (ts_rank(to_tsvector('russian', s.subject), q.tsq) + similarity(s.subject, p_query))::real AS rank
+                 FROM schedule s, q
+                 WHERE (to_tsvector('russian', s.subject) @@ q.tsq OR s.subject % p_query)
+                   AND (p_group_id IS NULL OR s.group_id = p_group_id)
+                   AND s.date >= CURRENT_DATE
+                 ORDER BY rank DESC, s.date
+                 LIMIT p_limit)
+            ) results
+            ORDER BY rank DESC, date
+            LIMIT p_limit
+        $fn$;
+    """),
+    (12, "Пересечения занятий с событиями календаря", """
+        CREATE TABLE IF NOT EXISTS schedule_conflicts (
+            lesson_id INTEGER REFERENCES schedule(id) ON DELETE CASCADE,
+            event_id INTEGER REFERENCES calendar_events(id) ON DELETE CASCADE,
+            group_id INTEGER NOT NULL,
+            date DATE NOT NULL,
+            overlap_start TIME NOT NULL,
+            overlap_end TIME NOT NULL,
+            PRIMARY KEY (lesson_id, event_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_schedule_conflicts_group_date ON schedule_conflicts (group_id, date);
+        CREATE INDEX IF NOT EXISTS idx_schedule_conflicts_event ON schedule_conflicts (event_id);
+
+        -- Дни, пересечения которых нужно пересчитать; group_id = 0 - все группы
+        CREATE TABLE IF NOT EXISTS conflict_dirty_days (
+            group_id INTEGER NOT NULL DEFAULT 0,
+            date DATE NOT NULL,
+            PRIMARY KEY (group_id, date)
+        );
+        CREATE INDEX IF NOT EXISTS idx_schedule_date ON schedule (date);
+
+        CREATE OR REPLACE VIEW schedule_conflicts_view AS
+        SELECT c.group_id, c.date, c.overlap_start, c.overlap_end,
+               s.id AS lesson_id, s.subject, s.start_time AS lesson_start, s.end_time AS lesson_end,
+               e.id AS event_id, e.title, e.calendar_name, e.start_time AS event_start, e.end_time AS event_end
+        FROM schedule_conflicts c
+        JOIN schedule s ON s.id = c.lesson_id
+        JOIN calendar_events e ON e.id = c.event_id;
+
+        -- Первичный расчет для текущих и будущих событий
+        INSERT INTO conflict_dirty_days (group_id, date)
+        SELECT DISTINCT 0, date FROM calendar_events WHERE date >= CURRENT_DATE - 7
+        ON CONFLICT DO NOTHING;
+    """),
+]
+
+
+class MigrationManager:
+    """
+    Применяет миграции схемы, которые еще не записаны в schema_migrations.
+    Одновременный запуск нескольких синхронизаций защищен advisory-блокировкой
+    """
+
+    # Ключ pg_advisory_xact_lock для миграций
+    LOCK_KEY = 727001
+
+    def __init__(self, db_manager, migrations: List[Tuple[int, str, str]] = None):
+        self.db_manager = db_manager
+        self.migrations = sorted(migrations or MIGRATIONS)
+
+    def migrate(self) -> bool:
+        """Применяет недостающие миграции по порядку, каждую в своей транзакции"""
+        if not self.db_manager.ensure_connection():
+            print("Не удалось подключиться для применения миграций")
+            return False
+
+        try:
+            with self.db_manager.get_connection() as connection, connection.cursor() as cursor:
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INTEGER PRIMARY KEY,
+                        description TEXT,
+                        applied_at TIMESTAMP DEFAULT NOW()
+                    )
+                """)
+                connection.commit()
+
+                cursor.execute("SELECT version FROM schema_migrations")
+                applied = {row[0] for row in cursor.fetchall()}
+                pending = [migration for migration in self.migrations if migration[0] not in applied]
+
+                if not pending:
+                    print(f"Схема БД актуальна (версия {max(applied, default=0)})")
+                    return True
+
+                for version, description, sql in pending:
+                    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (self.LOCK_KEY,))
+                    # Другой процесс мог применить миграцию, пока мы ждали блокировку
+                    cursor.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+                    if cursor.fetchone():
+                        connection.commit()
+                        continue
+
+                    cursor.execute(sql)
+                    cursor.execute(
+                        "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                        (version, description)
+                    )
+                    connection.commit()
+                    print(f"Применена миграция {version}: {description}")
+
+                return True
+
+        except Exception as e:
+            print(f"Ошибка применения миграций: {e}")
+            return False
@@ -0,0 +1,82 @@
+import argparse
+import glob
+import json
+import os
+import time
+from typing import List, Callable
+
+import JsonCodec
+from FakeApiServer import FakeApiData
+from ParserCal import GoogleCalendarParser
+from ParserSched import SchedulerParser
+
+
+def load_payloads(directory: str, pattern: str) -> List[bytes]:
+    """Читает сохраненные ответы API (по одному JSON на файл)"""
+    payloads = []
+    for path in sorted(glob.glob(os.path.join(directory, pattern))):
+        with open(path, 'rb') as f:
+            payloads.append(f.read())
+    return payloads
+
+
+def measure(name: str, payloads: List[bytes], repeat: int, func: Callable[[bytes], object]) -> float:
+    """Прогоняет func по всем ответам repeat раз, печатает и возвращает число ответов в секунду"""
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        for payload in payloads:
+            func(payload)
+    wall_time = time.perf_counter() - started_at
+    throughput = len(payloads) * repeat / wall_time if wall_time else 0.0
+    print(f"{name}: {throughput:.0f} ответов/с")
+    return throughput
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Микробенчмарк разбора ответов RUZ и Google Calendar")
+    arg_parser.add_argument('--payloads', help="каталог с сохраненными ответами: schedule_*.json и events_*.json")
+    arg_parser.add_argument('--groups', type=int, default=200, help="сколько ответов расписания сгенерировать")
+    arg_parser.add_argument('--calendars', type=int, default=20, help="сколько ответов календаря сгенерировать")
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    args = arg_parser.parse_args()
+
+    if args.payloads:
+        schedule_payloads = load_payloads(args.payloads, 'schedule_*.json')
+        event_payloads = load_payloads(args.payloads, 'events_*.json')
+    else:
+        data = FakeApiData(events_per_calendar=500)
+        today = time.strftime('%Y-%m-%d')
+        schedule_payloads = [
+            json.dumps(data.schedule_payload(group_id, today), ensure_ascii=False).encode('utf-8')
+            for group_id in range(1, args.groups + 1)
+        ]
+        event_payloads = [
+            json.dumps({'items': data.calendar_items(f"calendar{n}")}, ensure_ascii=False).encode('utf-8')
+            for n in range(args.calendars)
+        ]
+
+    if JsonCodec.orjson is None:
+        print("orjson не установлен, быстрый путь совпадает со стандартным json")
+
+    scheduler_parser = SchedulerParser()
+    calendar_parser = GoogleCalendarParser()
+
+    if schedule_payloads:
+        print(f"\nРасписание RUZ ({len(schedule_payloads)} ответов):")
+        baseline = measure("json + разбор", schedule_payloads, args.repeat,
+                           lambda payload: scheduler_parser.parse_week_schedule(json.loads(payload)))
+        fast = measure("JsonCodec + разбор", schedule_payloads, args.repeat,
+                       lambda payload: scheduler_parser.parse_week_schedule(JsonCodec.loads(payload)))
+        print(f"Ускорение: {fast / baseline:.2f}x")
+
+    if event_payloads:
+        print(f"\nСобытия календаря ({len(event_payloads)} ответов):")
+        baseline = measure("json + разбор", event_payloads, args.repeat,
+                           lambda payload: calendar_parser.parseEvents(json.loads(payload), 'benchmark'))
+        fast = measure("JsonCodec + разбор", event_payloads, args.repeat,
+                       lambda payload: calendar_parser.parseEvents(JsonCodec.loads(payload), 'benchmark'))
+        print(f"Ускорение: {fast / baseline:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,200 @@
 import requests
-from typing import List, Dict, Any
-from dataclasses import dataclass
-from datetime import datetime
-import time
+from typing import List, Dict, Any, Iterator, Optional, Tuple, Callable
+from dataclasses import dataclass, field
+from datetime import datetime, date, time, timezone, timedelta, tzinfo
+from zoneinfo import ZoneInfo
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import os
+import threading
+
+from Metrics import metrics
+from RateLimiter import AdaptiveRateLimiter
+from JsonCodec import decode_response
+
+
+# Событие длиннее этого числа дней не разворачивается по дням полностью
+MAX_EVENT_DAYS = 62
+
+START_OF_DAY = time(0, 0)
+END_OF_DAY = time(23, 59)
+
+
+def normalize_event_days(items: List[Dict[str, Any]], tz: tzinfo) -> List[List[Tuple[date, time, time]]]:
+    """
+    Переводит start/end всех событий страницы в локальное время tz за один проход:
+    каждая уникальная строка dateTime разбирается один раз. Для каждого события
+    возвращает список дней (date, start_time, end_time): многодневное событие
+    раскладывается по дням, событие на весь день занимает 00:00-23:59.
+    Событие без разбираемой даты дает пустой список
+    """
+    local_times = {}
+    for item in items:
+        for key in ('start', 'end'):
+            value = (item.get(key) or {}).get('dateTime')
+            if value and value not in local_times:
+                try:
+                    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+                except (TypeError, ValueError, AttributeError):
+                    local_times[value] = None
+                    continue
+                # Время без смещения считаем уже локальным
+                local_times[value] = parsed.astimezone(tz) if parsed.tzinfo else parsed.replace(tzinfo=tz)
+
+    days = []
+    for item in items:
+        start_data = item.get('start') or {}
+        end_data = item.get('end') or {}
+        start = local_times.get(start_data.get('dateTime'))
+        end = local_times.get(end_data.get('dateTime'))
+
+        if start is not None and end is not None:
+            days.append(_split_timed_event(start, end))
+        else:
+            days.append(_split_all_day_event(start_data.get('date', ''), end_data.get('date', '')))
+    return days
+
+
+def _minutes(value: datetime) -> time:
+    """Время события с точностью до минуты, без часового пояса (колонка TIME)"""
+    return time(value.hour, value.minute)
+
+
+def _split_timed_event(start: datetime, end: datetime) -> List[Tuple[date, time, time]]:
+    last_day = end.date()
+    end_time = _minutes(end)
+    # Событие, которое заканчивается в полночь, не заходит на следующий день
+    if end > start and end_time == START_OF_DAY:
+        last_day -= timedelta(days=1)
+        end_time = END_OF_DAY
+
+    first_day = start.date()
+    if last_day <= first_day:
+        return [(first_day, _minutes(start), end_time)]
+
+    last_day = min(last_day, first_day + timedelta(days=MAX_EVENT_DAYS - 1))
+    result = [(first_day, _minutes(start), END_OF_DAY)]
+    day = first_day + timedelta(days=1)
+    while day < last_day:
+        result.append((day, START_OF_DAY, END_OF_DAY))
+        day += timedelta(days=1)
+    result.append((last_day, START_OF_DAY, end_time))
+    return result
+
+
+def _split_all_day_event(start_date: str, end_date: str) -> List[Tuple[date, time, time]]:
+    # Дата окончания события на весь день не включается в событие
+    try:
+        first_day = date.fromisoformat(start_date)
+    except (TypeError, ValueError):
+        return []
+    try:
+        last_day = date.fromisoformat(end_date) - timedelta(days=1)
+    except (TypeError, ValueError):
+        last_day = first_day
+
+    last_day = min(last_day, first_day + timedelta(days=MAX_EVENT_DAYS - 1))
+    result = [(first_day, START_OF_DAY, END_OF_DAY)]
+    day = first_day + timedelta(days=1)
+    while day <= last_day:
+        result.append((day, START_OF_DAY, END_OF_DAY))
+        day += timedelta(days=1)
+    return result
+
+
+def local_window(time_min: str, time_max: str, tz: tzinfo) -> Tuple[date, date]:
+    """
+    Полные локальные дни, целиком покрытые запросом timeMin..timeMax.
+    Только в этих днях полная загрузка календаря видит все его события
+    """
+    start = datetime.fromisoformat(time_min.replace('Z', '+00:00')).astimezone(tz)
+    end = datetime.fromisoformat(time_max.replace('Z', '+00:00')).astimezone(tz)
+    first_day = start.date() if _minutes(start) == START_OF_DAY else start.date() + timedelta(days=1)
+    last_day = end.date() if _minutes(end) == END_OF_DAY else end.date() - timedelta(days=1)
+    return first_day, last_day
 
 
 @dataclass
 class CalendarEvent:
     title: str
     description: str
-    date: str
-    start_time: str
-    end_time: str
+    date: date
+    start_time: time
+    end_time: time
     location: str
     creator: str
     calendar_name: str
+    event_id: str = ''
+
+
+@dataclass
+class CalendarChanges:
+    events: List[CalendarEvent] = field(default_factory=list)
+    # Пары (calendar_name, event_id) отмененных событий
+    cancelled: List[Tuple[str, str]] = field(default_factory=list)
+    # Полная загрузка календаря: события, которых нет в events, удаляются из БД
+    # в полных локальных днях full_window (date_from, date_to)
+    calendar_name: str = ''
+    full_window: Optional[Tuple[date, date]] = None
+
+
+class CalendarSyncState:
+    """
+    Хранит syncToken и отметку времени последней загрузки по каждому календарю в JSON-файле.
+    Новое состояние календаря применяется только после commit(), то есть после успешной
+    записи его изменений в БД, и попадает в файл при save().
+    Состояние другой версии отбрасывается: следующая загрузка будет полной
+    """
+
+    # 2 - время событий хранится в часовом поясе парсера, многодневные события по дням
+    VERSION = 2
+
+    def __init__(self, path: str = 'calendar_sync_state.json'):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = {}
+        self.pending = {}
+
+        if os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    saved = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Не удалось прочитать состояние синхронизации {path}: {e}")
+            else:
+                if saved.get('version') == self.VERSION:
+                    self.state = saved.get('calendars', {})
+                else:
+                    print(f"Состояние синхронизации {path} устаревшего формата, календари будут загружены полностью")
+
+    def get(self, calendar_id: str) -> Dict[str, Any]:
+        with self.lock:
+            return dict(self.state.get(calendar_id, {}))
+
+    def set(self, calendar_id: str, value: Dict[str, Any]):
+        with self.lock:
+            self.pending[calendar_id] = value
+
+    def reset(self, calendar_id: str):
+        with self.lock:
+            self.state.pop(calendar_id, None)
+            self.pending.pop(calendar_id, None)
+
+    def commit(self, calendar_id: str = None):
+        """Применяет отложенное состояние календаря (или всех календарей)"""
+        with self.lock:
+            if calendar_id is None:
+                self.state.update(self.pending)
+                self.pending = {}
+            elif calendar_id in self.pending:
+                self.state[calendar_id] = self.pending.pop(calendar_id)
+
+    def save(self):
+        with self.lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': self.VERSION, 'calendars': self.state}, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
 
 
 class GoogleCalendarParser:
@@ -55,8 +235,68 @@ class GoogleCalendarParser:
          "name": "СуперКульторги"},
     ]
 
-    def __init__(self):
+    def __init__(self, max_workers: int = 8, sync_state: Optional[CalendarSyncState] = None,
+                 rate_limiter: Optional[AdaptiveRateLimiter] = None, timezone_name: str = 'Europe/Moscow'):
+        # Время событий в БД хранится в этом часовом поясе
+        self.timezone = ZoneInfo(timezone_name)
         self.session = requests.Session()
+        # Пул соединений не меньше числа потоков, иначе соединения будут пересоздаваться
+        self.session.mount('https://', requests.adapters.HTTPAdapter(
+            pool_connections=max_workers,
+            pool_maxsize=max_workers
+        ))
+        self.max_workers = max_workers
+        self.sync_state = sync_state
+        # Общий для всех потоков адаптивный ограничитель частоты запросов
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter(rate=10.0)
+
+    def __is_throttled(self, response: requests.Response) -> bool:
+        """429/503, а также 403 с причиной rateLimitExceeded, которой Google ограничивает частоту"""
+        if response.status_code in AdaptiveRateLimiter.THROTTLE_STATUSES:
+            return True
+        return response.status_code == 403 and 'ratelimitexceeded' in response.text.lower()
+
+    def __get_page(self, url: str, params: Dict[str, Any], max_retries: int = 3) -> requests.Response:
+        """Запрашивает страницу через ограничитель, повторяя запрос при ограничении частоты"""
+        for attempt in range(max_retries):
+            issued_at = self.rate_limiter.acquire()
+            try:
+                with metrics.timer('http_request_seconds', service='calendar', endpoint='events'):
+                    response = self.session.get(url, params=params)
+            except requests.exceptions.RequestException:
+                metrics.inc('http_errors_total', service='calendar', endpoint='events')
+                self.rate_limiter.on_throttle(issued_at=issued_at)
+                if attempt == max_retries - 1:
+                    raise
+                metrics.inc('http_retries_total', service='calendar', endpoint='events')
+                continue
+
+            metrics.inc('http_requests_total', service='calendar', endpoint='events', status=response.status_code)
+            if response.status_code < 400:
+                self.rate_limiter.on_success()
+                return response
+
+            metrics.inc('http_errors_total', service='calendar', endpoint='events')
+            if not self.__is_throttled(response) or attempt == max_retries - 1:
+                response.raise_for_status()
+
+            self.rate_limiter.on_throttle(AdaptiveRateLimiter.retry_after_seconds(response), issued_at)
+            metrics.inc('http_retries_total', service='calendar', endpoint='events')
+
+    def __iter_pages(self, url: str, params: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Отдает страницы ответа по мере загрузки, следуя nextPageToken"""
+        page_params = dict(params)
+        while True:
+            response = self.__get_page(url, page_params)
+
+            with metrics.timer('json_decode_seconds', service='calendar', endpoint='events'):
+                data = decode_response(response)
+            yield data
+
+            next_page_token = data.get('nextPageToken')
+            if not next_page_token:
+                return
+            page_params['pageToken'] = next_page_token
 
     def getEvents(self, calendar_id: str, calendar_name: str,
                   time_min: str, time_max: str,
@@ -72,71 +312,167 @@ class GoogleCalendarParser:
 
         url = f"{self.BASE_URL}{calendar_id}/events"
 
+        events = []
         try:
-            response = self.session.get(url, params=params)
-            if response.status_code == 200:
-                data = response.json()
-                return self.parseEvents(data, calendar_name)
-            else:
-                print(f"Ошибка {response.status_code} для календаря {calendar_name}")
-                return []
+            for data in self.__iter_pages(url, params):
+                with metrics.timer('parse_seconds', parser='calendar'):
+                    events.extend(self.parseEvents(data, calendar_name))
+            return events
+
+        except requests.exceptions.HTTPError as e:
+            print(f"Ошибка {e.response.status_code} для календаря {calendar_name}")
+            return events
 
         except Exception as e:
             print(f"Ошибка при получении событий из {calendar_name}: {e}")
-            return []
+            return events
 
     def parseEvents(self, data: Dict[str, Any], calendar_name: str) -> List[CalendarEvent]:
+        """
+        События страницы ответа во времени self.timezone. Многодневное событие
+        дает по строке на каждый день с тем же event_id
+        """
+        items = [item for item in data.get('items', []) if item.get('status') != 'cancelled']
         events = []
 
-        for event_data in data.get('items', []):
-            if event_data.get('status') == 'cancelled':
-                continue
+        for event_data, days in zip(items, normalize_event_days(items, self.timezone)):
+            title = event_data.get('summary', 'Без названия')
+            description = event_data.get('description', '')
+            location = event_data.get('location', '')
+            creator = (event_data.get('creator') or {}).get('email', 'Неизвестно')
+            event_id = event_data.get('id', '')
 
-            start_data = event_data.get('start', {})
-            end_data = event_data.get('end', {})
-
-            if 'dateTime' in start_data:
-                try:
-                    start_datetime = datetime.fromisoformat(start_data['dateTime'].replace('Z', '+00:00'))
-                    end_datetime = datetime.fromisoformat(end_data['dateTime'].replace('Z', '+00:00'))
-                    date = start_datetime.strftime('%Y-%m-%d')
-                    start_time = start_datetime.strftime('%H:%M')
-                    end_time = end_datetime.strftime('%H:%M')
-                except:
-                    date = start_data.get('date', '')
-                    start_time = '00:00'
-                    end_time = '23:59'
-            else:
-                date = start_data.get('date', '')
-                start_time = '00:00'
-                end_time = '23:59'
-
-            events.append(CalendarEvent(
-                title=event_data.get('summary', 'Без названия'),
-                description=event_data.get('description', ''),
-                date=date,
-                start_time=start_time,
-                end_time=end_time,
-                location=event_data.get('location', ''),
-                creator=event_data.get('creator', {}).get('email', 'Неизвестно'),
-                calendar_name=calendar_name
-            ))
+            for day, start_time, end_time in days:
+                events.append(CalendarEvent(
+                    title=title,
+                    description=description,
+                    date=day,
+                    start_time=start_time,
+                    end_time=end_time,
+                    location=location,
+                    creator=creator,
+                    calendar_name=calendar_name,
+                    event_id=event_id
+                ))
 
         return events
 
+    def parseCancelled(self, data: Dict[str, Any], calendar_name: str) -> List[Tuple[str, str]]:
+        """Возвращает идентификаторы отмененных (удаленных) событий"""
+        return [
+            (calendar_name, event_data['id'])
+            for event_data in data.get('items', [])
+            if event_data.get('status') == 'cancelled' and event_data.get('id')
+        ]
+
+    def getEventChanges(self, calendar_id: str, calendar_name: str,
+                        time_min: str, time_max: str,
+                        max_results: int = 2500) -> CalendarChanges:
+        """
+        Получает изменения календаря с прошлой загрузки по syncToken (или updatedMin).
+        Без сохраненного состояния или при смене периода выполняет полную загрузку
+        """
+        state = self.sync_state.get(calendar_id) if self.sync_state else {}
+        window = [time_min, time_max]
+        if state.get('window') != window:
+            state = {}
+
+        params = {
+            'key': self.API_KEY,
+            'maxResults': max_results,
+            'singleEvents': True
+        }
+        if state.get('sync_token'):
+            # syncToken несовместим с timeMin/timeMax/orderBy
+            params['syncToken'] = state['sync_token']
+        else:
+            params['timeMin'] = time_min
+            params['timeMax'] = time_max
+            if state.get('updated_min'):
+                params['updatedMin'] = state['updated_min']
+                params['showDeleted'] = True
+
+        url = f"{self.BASE_URL}{calendar_id}/events"
+        started_at = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        changes = CalendarChanges()
+        next_sync_token = None
+
+        try:
+            for data in self.__iter_pages(url, params):
+                with metrics.timer('parse_seconds', parser='calendar'):
+                    changes.events.extend(self.parseEvents(data, calendar_name))
+                changes.cancelled.extend(self.parseCancelled(data, calendar_name))
+                next_sync_token = data.get('nextSyncToken', next_sync_token)
+
+        except requests.exceptions.HTTPError as e:
+            # 410 Gone: токен устарел, нужна полная загрузка
+            if e.response.status_code == 410 and state:
+                print(f"Токен синхронизации для {calendar_name} устарел, выполняем полную загрузку")
+                self.sync_state.reset(calendar_id)
+                return self.getEventChanges(calendar_id, calendar_name, time_min, time_max, max_results)
+            print(f"Ошибка {e.response.status_code} для календаря {calendar_name}")
+            return CalendarChanges()
+
+        except Exception as e:
+            print(f"Ошибка при получении событий из {calendar_name}: {e}")
+            return CalendarChanges()
+
+        changes.calendar_name = calendar_name
+        if not state.get('sync_token') and not state.get('updated_min'):
+            # Получены все события периода: строки, которых среди них нет
+            # (в том числе записанные в другом часовом поясе), можно удалить
+            changes.full_window = local_window(time_min, time_max, self.timezone)
+
+        if self.sync_state:
+            self.sync_state.set(calendar_id, {
+                'window': window,
+                'sync_token': next_sync_token,
+                'updated_min': started_at
+            })
+
+        return changes
+
+    def __map_calendars(self, fetch: Callable[..., Any], time_min: str, time_max: str) -> Iterator[Tuple[Dict[str, str], Any]]:
+        """Вызывает fetch для всех календарей параллельно и отдает результаты по мере готовности"""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(
+                    fetch,
+                    calendar_id=calendar['id'],
+                    calendar_name=calendar['name'],
+                    time_min=time_min,
+                    time_max=time_max
+                ): calendar
+                for calendar in self.CALENDARS
+            }
+
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
     def getAllEvents(self, time_min: str, time_max: str) -> List[CalendarEvent]:
+        """Получает события всех календарей параллельно и возвращает их отсортированными"""
         all_events = []
 
-        for calendar in self.CALENDARS:
-            # ИСПРАВЛЕНИЕ: вызываем getEvents вместо get_events_from_calendar
-            events = self.getEvents(
-                calendar_id=calendar['id'],
-                calendar_name=calendar['name'],
-                time_min=time_min,
-                time_max=time_max
-            )
+        for calendar, events in self.__map_calendars(self.getEvents, time_min, time_max):
             all_events.extend(events)
-            time.sleep(0.1)
+            print(f"{calendar['name']}: {len(events)} событий")
 
         all_events.sort(key=lambda x: (x.date, x.start_time))
-        return all_events
\ No newline at end of file
+        return all_events
+
+    def iterAllEventChanges(self, time_min: str, time_max: str) -> Iterator[Tuple[Dict[str, str], CalendarChanges]]:
+        """Отдает изменения календарей по одному, по мере загрузки"""
+        for calendar, changes in self.__map_calendars(self.getEventChanges, time_min, time_max):
+            print(f"{calendar['name']}: {len(changes.events)} событий, отменено {len(changes.cancelled)}")
+            yield calendar, changes
+
+    def getAllEventChanges(self, time_min: str, time_max: str) -> CalendarChanges:
+        """Получает изменения всех календарей параллельно"""
+        all_changes = CalendarChanges()
+
+        for calendar, changes in self.iterAllEventChanges(time_min, time_max):
+            all_changes.events.extend(changes.events)
+            all_changes.cancelled.extend(changes.cancelled)
+
+        all_changes.events.sort(key=lambda x: (x.date, x.start_time))
+        return all_changes
@@ -1,9 +1,29 @@
 import requests
-from typing import List, Optional, Dict, Any
-from dataclasses import dataclass
+from typing import List, Optional, Dict, Any, Iterator, Tuple
+from dataclasses import dataclass, astuple
 from datetime import datetime, timedelta
+import hashlib
+import sys
+import re
+import json
 import time
-import random
+from concurrent.futures import ThreadPoolExecutor
+
+from RateLimiter import AdaptiveRateLimiter
+from ResponseCache import ResponseCache
+from Metrics import metrics
+from JsonCodec import decode_response
+
+
+class WeekFetchError(Exception):
+    """Не удалось получить часть недель периода"""
+
+    def __init__(self, group_id: int, errors: Dict[str, Exception]):
+        self.group_id = group_id
+        # Дата запроса недели -> ошибка
+        self.errors = errors
+        failed = ', '.join(f"{week_date}: {error}" for week_date, error in errors.items())
+        super().__init__(f"группа {group_id}: не получено недель {len(errors)} ({failed})")
 
 
 @dataclass
@@ -21,6 +41,9 @@ class Group:
 
 @dataclass
 class Lesson:
+    # Без __dict__: занятий при полном обходе десятки тысяч
+    __slots__ = ('subject', 'time_start', 'time_end', 'type', 'teacher', 'group', 'auditory', 'building')
+
     subject: str
     time_start: str
     time_end: str
@@ -33,6 +56,8 @@ class Lesson:
 
 @dataclass
 class Day:
+    __slots__ = ('date', 'weekday', 'lessons')
+
     date: str
     weekday: str
     lessons: List[Lesson]
@@ -40,9 +65,42 @@ class Day:
 
 @dataclass
 class Week:
+    __slots__ = ('group', 'week', 'days', 'fetched_at')
+
     group: Dict[str, Any]
     week: Dict[str, Any]
     days: List[Day]
+    # Когда ответ получен от RUZ (time.time()); для ответа из кеша - время его загрузки
+    fetched_at: Optional[float]
+
+    @property
+    def date_start(self) -> str:
+        """Дата начала недели в формате YYYY-MM-DD"""
+        return self.week.get('date_start', '').replace('.', '-')
+
+    @property
+    def date_end(self) -> str:
+        """Дата окончания недели в формате YYYY-MM-DD"""
+        return self.week.get('date_end', '').replace('.', '-')
+
+    def fingerprint(self) -> str:
+        """Хеш содержимого недели: совпадает, если занятия не изменились"""
+        content = [
+            [day.date, day.weekday, [list(astuple(lesson)) for lesson in day.lessons]]
+            for day in self.days
+        ]
+        return hashlib.sha256(json.dumps(content, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def iter_rows(self, group_id: int) -> Iterator[tuple]:
+        """
+        Строки таблицы schedule: (group_id, date, weekday, subject, type,
+        start_time, end_time, teacher, audithory, place)
+        """
+        for day in self.days:
+            for lesson in day.lessons:
+                yield (group_id, day.date, day.weekday, lesson.subject, lesson.type,
+                       lesson.time_start, lesson.time_end, lesson.teacher, lesson.auditory,
+                       lesson.building or '')
 
 
 @dataclass
@@ -52,87 +110,169 @@ class SemesterSchedule:
     start_date: str
     end_date: str
 
+    @property
+    def fetched_at(self) -> Optional[float]:
+        """Время загрузки самой старой недели периода: данные не свежее его"""
+        fetched = [week.fetched_at for week in self.weeks if week.fetched_at is not None]
+        return min(fetched) if fetched else None
+
+    def fingerprint(self) -> str:
+        """Хеш расписания за весь период по хешам недель"""
+        week_fingerprints = [week.fingerprint() for week in self.weeks]
+        return hashlib.sha256('|'.join(week_fingerprints).encode('utf-8')).hexdigest()
+
 
 class SchedulerParser:
     BASE_URL = "https://ruz.spbstu.ru/api/v1/ruz/"
 
-    def __init__(self):
+    def __init__(self, rate_limiter: Optional[AdaptiveRateLimiter] = None,
+                 response_cache: Optional[ResponseCache] = None, pool_maxsize: int = 30):
         self.session = requests.Session()
-        # Увеличиваем таймауты и добавляем повторные попытки
+        # Общий для всех потоков адаптивный ограничитель частоты запросов
+        self.rate_limiter = rate_limiter or AdaptiveRateLimiter()
+        # Кеш ответов API (свежие ответы не запрашиваются повторно)
+        self.response_cache = response_cache
+        # Режим обновления: свежий кеш не используется без проверки, каждый запрос
+        # уходит в RUZ (условно, с ETag), устаревший ответ при ошибке не подставляется
+        self.revalidate = False
+        # Число одновременных запросов (потоки групп * потоки недель) не должно
+        # превышать pool_maxsize, иначе лишние соединения открываются и закрываются заново
+        self.pool_maxsize = pool_maxsize
+        # Повторные попытки выполняет __make_request через ограничитель, не urllib3
         self.session.mount('https://', requests.adapters.HTTPAdapter(
-            max_retries=3,
             pool_connections=10,
-            pool_maxsize=30
+            pool_maxsize=pool_maxsize
         ))
 
-    def __make_request(self, endpoint: str, params: Optional[Dict] = None, max_retries: int = 3) -> Dict[str, Any]:
+    def __make_request(self, endpoint: str, params: Optional[Dict] = None,
+                       max_retries: int = 3) -> Tuple[Dict[str, Any], float]:
+        """Ответ endpoint и время, когда он получен от RUZ (для ответа из кеша - время загрузки в кеш)"""
         url = f"{self.BASE_URL}{endpoint}"
+        # Метка endpoint без идентификаторов: scheduler/{id}, faculties/{id}/groups
+        endpoint_label = re.sub(r'\d+', '{id}', endpoint)
+
+        cached = self.response_cache.get(endpoint, params) if self.response_cache else None
+        if cached and cached.is_fresh and not self.revalidate:
+            metrics.inc('cache_hits_total', service='ruz', endpoint=endpoint_label)
+            return cached.data, cached.fetched_at
+
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        }
+        # Условный запрос: сервер ответит 304, если данные не изменились
+        if cached and cached.etag:
+            headers['If-None-Match'] = cached.etag
+        if cached and cached.last_modified:
+            headers['If-Modified-Since'] = cached.last_modified
 
         for attempt in range(max_retries):
             try:
-                response = self.session.get(
-                    url,
-                    params=params,
-                    timeout=30,  # Увеличиваем таймаут
-                    headers={
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                    }
-                )
-                response.raise_for_status()
-                return response.json()
+                issued_at = self.rate_limiter.acquire()
+
+                with metrics.timer('http_request_seconds', service='ruz', endpoint=endpoint_label):
+                    response = self.session.get(
+                        url,
+                        params=params,
+                        timeout=30,  # Увеличиваем таймаут
+                        headers=headers
+                    )
+                metrics.inc('http_requests_total', service='ruz', endpoint=endpoint_label,
+                            status=response.status_code)
+
+                if response.status_code == 304 and cached:
+                    metrics.inc('cache_revalidated_total', service='ruz', endpoint=endpoint_label)
+                    self.rate_limiter.on_success()
+                    self.response_cache.touch(endpoint, params)
+                    return cached.data, time.time()
 
-            except requests.exceptions.RequestException as e:
+                response.raise_for_status()
+                self.rate_limiter.on_success()
+                with metrics.timer('json_decode_seconds', service='ruz', endpoint=endpoint_label):
+                    data = decode_response(response)
+
+                if self.response_cache:
+                    self.response_cache.put(
+                        endpoint, params, data,
+                        etag=response.headers.get('ETag'),
+                        last_modified=response.headers.get('Last-Modified')
+                    )
+                return data, time.time()
+
+            except (requests.exceptions.RequestException, ValueError) as e:
+                # ValueError - ответ 200 с битым JSON (JSONDecodeError json и orjson)
                 print(f"Попытка {attempt + 1}/{max_retries} не удалась для {url}: {e}")
-                if attempt < max_retries - 1:
-                    # Увеличиваем задержку с каждой попыткой
-                    sleep_time = (2 ** attempt) + random.uniform(0.1, 0.5)
-                    print(f"Ожидание {sleep_time:.2f} секунд перед повторной попыткой...")
-                    time.sleep(sleep_time)
+                metrics.inc('http_errors_total', service='ruz', endpoint=endpoint_label)
+
+                # Сетевая ошибка, 429 или 5xx - сервер не справляется, снижаем частоту.
+                # Битый ответ повторяем без снижения частоты. Остальные 4xx повторять бессмысленно
+                error_response = getattr(e, 'response', None)
+                decode_error = not isinstance(e, requests.exceptions.RequestException)
+                retryable = (decode_error
+                             or error_response is None
+                             or error_response.status_code in AdaptiveRateLimiter.THROTTLE_STATUSES
+                             or error_response.status_code >= 500)
+                if retryable and not decode_error:
+                    self.rate_limiter.on_throttle(AdaptiveRateLimiter.retry_after_seconds(error_response), issued_at)
+
+                if retryable and attempt < max_retries - 1:
+                    metrics.inc('http_retries_total', service='ruz', endpoint=endpoint_label)
                 else:
                     print(f"Все попытки не удались для {url}")
+                    # Если есть устаревший ответ в кеше, используем его
+                    # (кроме режима обновления: там нужен ответ именно от RUZ)
+                    if cached and not self.revalidate:
+                        print(f"Используем сохраненный ответ для {url}")
+                        metrics.inc('cache_stale_used_total', service='ruz', endpoint=endpoint_label)
+                        return cached.data, cached.fetched_at
                     raise
 
-    def __parse_schedule(self, data: Dict[str, Any]) -> Week:
+    def __parse_schedule(self, data: Dict[str, Any], fetched_at: Optional[float] = None) -> Week:
+        # Повторяющиеся строки (предметы, преподаватели, аудитории, время) интернируются,
+        # чтобы все занятия ссылались на один объект строки
+        intern = sys.intern
         days = []
+        default_group_name = data['group'].get('name') or ''
 
         for day_data in data.get('days', []):
             lessons = []
 
             for lesson in day_data.get('lessons', []):
-                # Извлекаем информацию о здании
+                time_start = lesson.get('time_start')
+                time_end = lesson.get('time_end')
+                # Занятие без времени нельзя записать в schedule (start_time входит в ключ)
+                if not time_start or not time_end:
+                    continue
+
+                # Извлекаем информацию об аудитории и здании
+                auditory_name = ''
                 building_name = ''
-                if lesson.get('auditories'):
-                    building_data = lesson['auditories'][0].get('building', {})
-                    building_name = building_data.get('abbr', '')
+                auditories = lesson.get('auditories')
+                if auditories:
+                    auditory = auditories[0]
+                    auditory_name = auditory.get('name') or ''
+                    building_name = (auditory.get('building') or {}).get('abbr') or ''
 
                 # Извлекаем информацию о преподавателе
                 teacher_name = ''
-                if lesson.get('teachers'):
-                    teacher_name = lesson['teachers'][0].get('full_name', '')
+                teachers = lesson.get('teachers')
+                if teachers:
+                    teacher_name = teachers[0].get('full_name') or ''
 
                 # Извлекаем информацию о группе
-                group_name = ''
-                if lesson.get('groups'):
-                    group_name = lesson['groups'][0].get('name', '')
-                else:
-                    group_name = data['group'].get('name', '')
-
-                # Извлекаем информацию об аудитории
-                auditory_name = ''
-                if lesson.get('auditories'):
-                    auditory_name = lesson['auditories'][0].get('name', '')
-
-                lesson_obj = Lesson(
-                    subject=lesson['subject'],
-                    time_start=lesson['time_start'],
-                    time_end=lesson['time_end'],
-                    type=lesson['typeObj']['name'],
-                    teacher=teacher_name,
-                    group=group_name,
-                    auditory=auditory_name,
-                    building=building_name
-                )
-                lessons.append(lesson_obj)
+                groups = lesson.get('groups')
+                group_name = (groups[0].get('name') or '') if groups else default_group_name
+
+                # RUZ присылает null в необязательных полях, sys.intern принимает только str
+                lessons.append(Lesson(
+                    subject=intern(lesson.get('subject') or ''),
+                    time_start=intern(time_start),
+                    time_end=intern(time_end),
+                    type=intern((lesson.get('typeObj') or {}).get('name') or ''),
+                    teacher=intern(teacher_name),
+                    group=intern(group_name),
+                    auditory=intern(auditory_name),
+                    building=intern(building_name)
+                ))
 
             days.append(Day(
                 date=day_data['date'],
@@ -140,14 +280,18 @@ class SchedulerParser:
                 lessons=lessons
             ))
 
+        # Из исходных словарей оставляем только используемые поля
+        group = data['group']
+        week = data['week']
         return Week(
-            group=data['group'],
-            week=data['week'],
-            days=days
+            group={'id': group.get('id'), 'name': group.get('name') or ''},
+            week={key: week[key] for key in ('date_start', 'date_end', 'is_odd') if key in week},
+            days=days,
+            fetched_at=fetched_at
         )
 
     def get_faculties(self) -> List[Faculty]:
-        data = self.__make_request("faculties")
+        data, _ = self.__make_request("faculties")
         return [
             Faculty(
                 id=faculty['id'],
@@ -158,7 +302,7 @@ class SchedulerParser:
         ]
 
     def get_groups_by_faculty(self, faculty_id: int) -> List[Group]:
-        data = self.__make_request(f"faculties/{faculty_id}/groups")
+        data, _ = self.__make_request(f"faculties/{faculty_id}/groups")
         return [
             Group(
                 id=group['id'],
@@ -167,61 +311,118 @@ class SchedulerParser:
             for group in data.get('groups', [])
         ]
 
+    def parse_week_schedule(self, data: Dict[str, Any]) -> Week:
+        """Разбирает уже загруженный ответ scheduler/{id} (для бенчмарков и сохраненных ответов)"""
+        return self.__parse_schedule(data)
+
     def get_week_schedule_by_group(self, group_id: int) -> Optional[Week]:
         try:
-            data = self.__make_request(f"scheduler/{group_id}")
-            return self.__parse_schedule(data)
+            data, fetched_at = self.__make_request(f"scheduler/{group_id}")
+            with metrics.timer('parse_seconds', parser='ruz'):
+                return self.__parse_schedule(data, fetched_at)
         except Exception as e:
             print(f"Ошибка получения расписания для группы {group_id}: {e}")
             return None
 
-    def get_week_schedule_by_group_and_date(self, group_id: int, schedule_date: str) -> Optional[Week]:
+    def get_week_schedule_by_group_and_date(self, group_id: int, schedule_date: str) -> Week:
+        """
+        Расписание группы на неделю, в которую входит schedule_date.
+        Ошибка загрузки пробрасывается: неделя без ответа не считается пустой
+        """
         try:
-            data = self.__make_request(f"scheduler/{group_id}", params={'date': schedule_date})
-            return self.__parse_schedule(data)
+            data, fetched_at = self.__make_request(f"scheduler/{group_id}", params={'date': schedule_date})
+            with metrics.timer('parse_seconds', parser='ruz'):
+                return self.__parse_schedule(data, fetched_at)
         except Exception as e:
             print(f"Ошибка получения расписания для группы {group_id} на дату {schedule_date}: {e}")
-            return None
+            raise
 
     def get_semester_schedule(self, group_id: int, start_date: Optional[str] = None,
-                              end_date: Optional[str] = None, max_weeks: int = 6) -> SemesterSchedule:
+                              end_date: Optional[str] = None, max_weeks: int = 6,
+                              parallel: bool = False, week_workers: Optional[int] = None) -> SemesterSchedule:
         """
-        Получает расписание на указанный период
+        Получает расписание на указанный период.
+        В режиме parallel недели запрашиваются одновременно, не больше week_workers сразу.
+        Если хотя бы одну неделю получить не удалось, выбрасывается исключение
+        (в режиме parallel - WeekFetchError со всеми неполученными неделями)
         """
         weeks = []
 
         # Используем дату начала или текущую дату
         current_date = start_date or datetime.now().strftime('%Y-%m-%d')
 
-        for week_num in range(max_weeks):
-            try:
-                week_schedule = self.get_week_schedule_by_group_and_date(group_id, current_date)
+        if parallel:
+            return self.__get_semester_schedule_parallel(group_id, current_date, end_date, max_weeks,
+                                                         week_workers)
 
-                if not week_schedule:
-                    break
-
-                weeks.append(week_schedule)
+        for week_num in range(max_weeks):
+            # Ошибка загрузки недели прерывает весь период: частичное расписание
+            # нельзя записывать как полное
+            week_schedule = self.get_week_schedule_by_group_and_date(group_id, current_date)
+            weeks.append(week_schedule)
 
-                # Получаем дату начала следующей недели
-                current_week_end = week_schedule.week.get('date_end', current_date)
-                next_date = self.__get_next_week_date(current_week_end)
-                current_date = next_date
+            # Получаем дату начала следующей недели
+            current_week_end = week_schedule.week.get('date_end', current_date)
+            next_date = self.__get_next_week_date(current_week_end)
+            current_date = next_date
 
-                # Задержка между запросами
-                sleep_time = random.uniform(1.0, 2.0)
-                time.sleep(sleep_time)
+        return self.__build_semester_schedule(weeks, current_date)
 
-            except Exception as e:
-                # Продолжаем со следующей недели (добавляем 7 дней)
-                try:
-                    current_date_obj = datetime.strptime(current_date, '%Y-%m-%d')
-                    next_date = current_date_obj + timedelta(days=7)
-                    current_date = next_date.strftime('%Y-%m-%d')
-                except:
-                    break
+    def __get_semester_schedule_parallel(self, group_id: int, start_date: str, end_date: Optional[str],
+                                         max_weeks: int, week_workers: Optional[int]) -> SemesterSchedule:
+        """
+        Вычисляет понедельники всех недель периода заранее и запрашивает недели параллельно.
+        Порядок недель сохраняется. Дожидается всех недель и, если часть не получена,
+        выбрасывает WeekFetchError со списком неполученных недель
+        """
+        mondays = self.__get_week_mondays(start_date, end_date, max_weeks)
+        if not mondays:
+            return self.__build_semester_schedule([], start_date)
+
+        with ThreadPoolExecutor(max_workers=min(len(mondays), week_workers or len(mondays))) as executor:
+            futures = [
+                executor.submit(self.get_week_schedule_by_group_and_date, group_id, monday)
+                for monday in mondays
+            ]
+
+        fetched = []
+        errors = {}
+        for monday, future in zip(mondays, futures):
+            error = future.exception()
+            if error is not None:
+                errors[monday] = error
+            else:
+                fetched.append(future.result())
+        if errors:
+            metrics.inc('weeks_failed_total', len(errors), parser='ruz')
+            raise WeekFetchError(group_id, errors)
 
-        start_date = weeks[0].week['date_start'] if weeks else current_date
-        end_date = weeks[-1].week['date_end'] if weeks else current_date
+        weeks = []
+        seen_weeks = set()
+        for week_schedule in fetched:
+            # На каникулах RUZ может вернуть одну и ту же неделю для разных дат
+            if week_schedule.date_start in seen_weeks:
+                continue
+            seen_weeks.add(week_schedule.date_start)
+            weeks.append(week_schedule)
+
+        return self.__build_semester_schedule(weeks, start_date)
+
+    def __get_week_mondays(self, start_date: str, end_date: Optional[str], max_weeks: int) -> List[str]:
+        """Возвращает даты понедельников недель периода, не больше max_weeks"""
+        start = datetime.strptime(start_date, '%Y-%m-%d')
+        end = datetime.strptime(end_date.replace('.', '-'), '%Y-%m-%d') if end_date else None
+
+        monday = start - timedelta(days=start.weekday())
+        mondays = []
+        while len(mondays) < max_weeks and (end is None or monday <= end):
+            mondays.append(monday.strftime('%Y-%m-%d'))
+            monday += timedelta(days=7)
+        return mondays
+
+    def __build_semester_schedule(self, weeks: List[Week], fallback_date: str) -> SemesterSchedule:
+        start_date = weeks[0].week['date_start'] if weeks else fallback_date
+        end_date = weeks[-1].week['date_end'] if weeks else fallback_date
 
         return SemesterSchedule(
             group=weeks[0].group if weeks else {},
@@ -0,0 +1,123 @@
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Глобальный ограничитель частоты запросов (token bucket), общий для всех потоков
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        # До этого момента запросы не выдаются (пауза по требованию сервера)
+        self.blocked_until = 0.0
+        # Реентерабельная: наследники меняют частоту через set_rate/pause под той же блокировкой
+        self.lock = threading.RLock()
+
+    def __refill(self):
+        now = time.monotonic()
+        # Во время паузы updated_at находится в будущем, токены не начисляются
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """
+        Блокирует поток, пока в корзине не появится нужное количество токенов.
+        Возвращает момент выдачи (time.monotonic())
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    wait_time = self.blocked_until - now
+                else:
+                    self.__refill()
+                    if self.tokens >= tokens:
+                        self.tokens -= tokens
+                        return now
+                    wait_time = (tokens - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+    def set_rate(self, rate: float):
+        with self.lock:
+            self.__refill()
+            self.rate = rate
+
+    def pause(self, seconds: float):
+        """Приостанавливает выдачу токенов всем потокам и сбрасывает накопленные токены"""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+            self.updated_at = max(self.updated_at, self.blocked_until)
+
+
+class AdaptiveRateLimiter(TokenBucket):
+    """
+    Адаптивный ограничитель (AIMD): пока сервер отвечает успешно, частота растет
+    на increase запросов/с, при 429/503 или сетевой ошибке умножается на decrease.
+    Заголовок Retry-After приостанавливает все потоки на указанное сервером время.
+    Частота снижается не чаще раза за окно: ошибки запросов, выданных до последнего
+    снижения, уже учтены им и частоту не снижают
+    """
+
+    THROTTLE_STATUSES = (429, 503)
+
+    def __init__(self, rate: float = 5.0, min_rate: float = 0.5, max_rate: float = 50.0,
+                 increase: float = 0.1, decrease: float = 0.5, backoff: float = 1.0):
+        super().__init__(rate, capacity=max(1.0, rate))
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        # Пауза после ошибки без Retry-After, растет с каждой ошибкой подряд
+        self.backoff = backoff
+        self.failures_in_row = 0
+        # Момент последнего снижения частоты (time.monotonic())
+        self.last_decrease_at = float('-inf')
+
+    def on_success(self):
+        with self.lock:
+            self.failures_in_row = 0
+            self.set_rate(min(self.max_rate, self.rate + self.increase))
+
+    def on_throttle(self, retry_after: Optional[float] = None, issued_at: Optional[float] = None):
+        """
+        Реакция на ограничение частоты. issued_at - значение, которое вернул acquire()
+        для этого запроса; без него ошибка всегда снижает частоту
+        """
+        with self.lock:
+            if issued_at is not None and issued_at < self.last_decrease_at:
+                # Запрос ушел до последнего снижения: учитываем только явную паузу сервера
+                if retry_after is not None:
+                    self.pause(retry_after)
+                return
+
+            self.failures_in_row += 1
+            self.set_rate(max(self.min_rate, self.rate * self.decrease))
+            self.last_decrease_at = time.monotonic()
+            if retry_after is None:
+                retry_after = self.backoff * (2 ** min(self.failures_in_row - 1, 5))
+            self.pause(retry_after)
+
+    @staticmethod
+    def retry_after_seconds(response) -> Optional[float]:
+        """Разбирает заголовок Retry-After: число секунд или HTTP-дата"""
+        value = response.headers.get('Retry-After') if response is not None else None
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+            return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
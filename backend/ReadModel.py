@@ -0,0 +1,286 @@
+import argparse
+import hashlib
+import json
+import re
+import threading
+from datetime import datetime, timedelta, date as date_type
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, List, Tuple, Optional
+from urllib.parse import urlparse, unquote
+
+from psycopg2.extras import execute_values
+
+from Metrics import metrics
+
+
+def dump_snapshot(payload: Dict[str, Any]) -> Tuple[str, str]:
+    """Компактный JSON снимка и его ETag (sha256 содержимого)"""
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+    return body, hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+def format_time(value) -> Optional[str]:
+    return value.strftime('%H:%M') if value is not None else None
+
+
+class SnapshotBuilder:
+    """
+    Материализует готовые для клиента снимки: одна неделя расписания группы
+    и один месяц событий календаря - одна строка. Пересобираются только недели,
+    хеш которых в schedule_week_fingerprints отличается от хеша снимка
+    """
+
+    def __init__(self, db_manager, batch_size: int = 500):
+        self.db_manager = db_manager
+        self.batch_size = batch_size
+
+    def build_schedule_snapshots(self) -> int:
+        """Пересобирает снимки измененных недель, возвращает их число"""
+        with self.db_manager.get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT f.group_id, f.week_start, f.fingerprint
+                FROM schedule_week_fingerprints f
+                LEFT JOIN schedule_snapshots s
+                    ON s.group_id = f.group_id AND s.week_start = f.week_start
+                WHERE s.fingerprint IS DISTINCT FROM f.fingerprint
+                ORDER BY f.group_id, f.week_start
+            """)
+            dirty_weeks = cursor.fetchall()
+            connection.commit()
+
+        built = 0
+        for offset in range(0, len(dirty_weeks), self.batch_size):
+            built += self.__build_schedule_batch(dirty_weeks[offset:offset + self.batch_size])
+
+        print(f"Снимков недель расписания обновлено: {built}")
+        return built
+
+    def __build_schedule_batch(self, weeks: List[Tuple[int, date_type, str]]) -> int:
+        snapshots = {
+            (group_id, week_start): {'group_id': group_id, 'week_start': week_start.isoformat(), 'days': []}
+            for group_id, week_start, _ in weeks
+        }
+
+        with self.db_manager.get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT w.group_id, w.week_start, s.date, s.weekday, s.subject, s.type,
+                       s.start_time, s.end_time, s.teacher, s.audithory, s.place
+                FROM unnest(%s::int[], %s::date[]) AS w(group_id, week_start)
+                JOIN schedule s
+                    ON s.group_id = w.group_id
+                   AND s.date >= w.week_start AND s.date < w.week_start + 7
+                ORDER BY w.group_id, w.week_start, s.date, s.start_time
+            """, ([group_id for group_id, _, _ in weeks], [week_start for _, week_start, _ in weeks]))
+
+            for (group_id, week_start, day, weekday, subject, lesson_type,
+                 start_time, end_time, teacher, audithory, place) in cursor.fetchall():
+                days = snapshots[(group_id, week_start)]['days']
+                if not days or days[-1]['date'] != day.isoformat():
+                    days.append({'date': day.isoformat(), 'weekday': weekday, 'lessons': []})
+                days[-1]['lessons'].append({
+                    'subject': subject,
+                    'type': lesson_type,
+                    'start_time': format_time(start_time),
+                    'end_time': format_time(end_time),
+                    'teacher': teacher,
+                    'audithory': audithory,
+                    'place': place,
+                })
+
+            rows = []
+            for group_id, week_start, fingerprint in weeks:
+                body, etag = dump_snapshot(snapshots[(group_id, week_start)])
+                rows.append((group_id, week_start, body, etag, fingerprint))
+
+            execute_values(cursor, """
+                INSERT INTO schedule_snapshots (group_id, week_start, payload, etag, fingerprint)
+                VALUES %s
+                ON CONFLICT (group_id, week_start) DO UPDATE SET
+                    payload = EXCLUDED.payload,
+                    etag = EXCLUDED.etag,
+                    fingerprint = EXCLUDED.fingerprint,
+                    updated_at = NOW()
+            """, rows, page_size=self.batch_size)
+            connection.commit()
+
+        metrics.inc('snapshots_built_total', len(weeks), kind='schedule_week')
+        return len(weeks)
+
+    def build_calendar_snapshots(self, month: date_type) -> int:
+        """
+        Пересобирает снимки всех календарей за месяц, начинающийся с month.
+        Строки с неизменным ETag не перезаписываются. Возвращает число измененных снимков
+        """
+        month = month.replace(day=1)
+        next_month = (month + timedelta(days=32)).replace(day=1)
+
+        with self.db_manager.get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT calendar_name, event_id, title, description, date, start_time, end_time,
+                       location, creator
+                FROM calendar_events
+                WHERE date >= %s AND date < %s
+                ORDER BY calendar_name, date, start_time, title
+            """, (month, next_month))
+
+            snapshots: Dict[str, Dict[str, Any]] = {}
+            for (calendar_name, event_id, title, description, day, start_time, end_time,
+                 location, creator) in cursor.fetchall():
+                snapshot = snapshots.setdefault(calendar_name, {
+                    'calendar_name': calendar_name, 'month': month.isoformat(), 'events': []
+                })
+                snapshot['events'].append({
+                    'event_id': event_id,
+                    'title': title,
+                    'description': description,
+                    'date': day.isoformat(),
+                    'start_time': format_time(start_time),
+                    'end_time': format_time(end_time),
+                    'location': location,
+                    'creator': creator,
+                })
+
+            rows = []
+            for calendar_name, snapshot in snapshots.items():
+                body, etag = dump_snapshot(snapshot)
+                rows.append((calendar_name, month, body, etag))
+
+            changed = []
+            if rows:
+                changed = execute_values(cursor, """
+                    INSERT INTO calendar_month_snapshots (calendar_name, month, payload, etag)
+                    VALUES %s
+                    ON CONFLICT (calendar_name, month) DO UPDATE SET
+                        payload = EXCLUDED.payload,
+                        etag = EXCLUDED.etag,
+                        updated_at = NOW()
+                    WHERE calendar_month_snapshots.etag <> EXCLUDED.etag
+                    RETURNING calendar_name
+                """, rows, fetch=True)
+
+            # Календари, у которых в этом месяце не осталось событий
+            cursor.execute("""
+                DELETE FROM calendar_month_snapshots
+                WHERE month = %s AND NOT (calendar_name = ANY(%s::text[]))
+            """, (month, list(snapshots)))
+            connection.commit()
+
+        metrics.inc('snapshots_built_total', len(changed), kind='calendar_month')
+        print(f"Снимков месяца {month:%Y-%m} календарей обновлено: {len(changed)}")
+        return len(changed)
+
+
+class SnapshotServer:
+    """
+    HTTP API для чтения снимков:
+      GET /schedule/{group_id}/{date}     - неделя группы, в которую входит date
+      GET /calendar/{calendar_name}/{YYYY-MM} - события календаря за месяц
+    Отдает ETag и отвечает 304 на совпадающий If-None-Match.
+    Потоков запросов может быть больше, чем соединений в пуле: чтение снимка ждет
+    свободное соединение на семафоре, а не получает PoolError
+    """
+
+    WEEK_PATH = re.compile(r'^/schedule/(\d+)/(\d{4}-\d{2}-\d{2})$')
+    MONTH_PATH = re.compile(r'^/calendar/(.+)/(\d{4}-\d{2})$')
+
+    def __init__(self, db_manager, host: str = '0.0.0.0', port: int = 8080):
+        self.db_manager = db_manager
+        self.connection_slots = threading.BoundedSemaphore(db_manager.max_connections)
+        self.server = ThreadingHTTPServer((host, port), self.__make_handler())
+        self.server.daemon_threads = True
+
+    def lookup(self, path: str) -> Optional[Tuple[str, str]]:
+        """Находит снимок по пути запроса: (payload, etag) или None"""
+        match = self.WEEK_PATH.match(path)
+        if match:
+            day = datetime.strptime(match.group(2), '%Y-%m-%d').date()
+            week_start = day - timedelta(days=day.weekday())
+            query = "SELECT payload, etag FROM schedule_snapshots WHERE group_id = %s AND week_start = %s"
+            params = (int(match.group(1)), week_start)
+        else:
+            match = self.MONTH_PATH.match(path)
+            if not match:
+                return None
+            query = "SELECT payload, etag FROM calendar_month_snapshots WHERE calendar_name = %s AND month = %s"
+            params = (unquote(match.group(1)), f"{match.group(2)}-01")
+
+        with self.connection_slots:
+            with self.db_manager.get_connection() as connection, connection.cursor() as cursor:
+                cursor.execute(query, params)
+                row = cursor.fetchone()
+                connection.rollback()
+        return row
+
+    def serve_forever(self):
+        host, port = self.server.server_address[:2]
+        print(f"API снимков слушает http://{host}:{port}")
+        self.server.serve_forever()
+
+    def __make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                try:
+                    snapshot = server.lookup(urlparse(self.path).path)
+                except ValueError:
+                    self.send_error(400)
+                    return
+                except Exception as e:
+                    print(f"Ошибка чтения снимка {self.path}: {e}")
+                    self.send_error(503)
+                    return
+
+                if snapshot is None:
+                    self.send_error(404)
+                    return
+
+                payload, etag = snapshot
+                quoted_etag = f'"{etag.strip()}"'
+                if self.headers.get('If-None-Match') == quoted_etag:
+                    metrics.inc('snapshot_requests_total', status=304)
+                    self.send_response(304)
+                    self.send_header('ETag', quoted_etag)
+                    self.end_headers()
+                    return
+
+                metrics.inc('snapshot_requests_total', status=200)
+                body = payload.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', quoted_etag)
+                self.send_header('Cache-Control', 'no-cache')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="HTTP API снимков расписания и календаря")
+    arg_parser.add_argument('--host', default='0.0.0.0')
+    arg_parser.add_argument('--port', type=int, default=8080)
+    arg_parser.add_argument('--dsn', help="строка подключения к PostgreSQL вместо настроек по умолчанию")
+    args = arg_parser.parse_args()
+
+    # main импортирует этот модуль для сборки снимков, поэтому импорт здесь
+    from main import DatabaseManager
+    db_manager = DatabaseManager(db_config={'dsn': args.dsn}, sslmode='prefer') if args.dsn else DatabaseManager()
+    if not db_manager.connect():
+        print("Не удалось подключиться к базе данных")
+        return
+
+    try:
+        SnapshotServer(db_manager, host=args.host, port=args.port).serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db_manager.disconnect()
+
+
+if __name__ == "__main__":
+    main()
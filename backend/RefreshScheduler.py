@@ -0,0 +1,152 @@
+import math
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import List, Optional
+
+
+@dataclass
+class RefreshTier:
+    name: str
+    # Минимальная оценка группы для попадания в уровень
+    min_score: float
+    # Максимальный возраст данных группы этого уровня (SLA свежести)
+    max_age: timedelta
+
+
+# Уровни от самого горячего к холодному
+DEFAULT_TIERS = [
+    RefreshTier('hot', min_score=3.0, max_age=timedelta(hours=1)),
+    RefreshTier('warm', min_score=0.5, max_age=timedelta(hours=6)),
+    RefreshTier('cold', min_score=0.0, max_age=timedelta(hours=24)),
+]
+
+
+@dataclass
+class GroupPriority:
+    group_id: int
+    score: float
+    tier: RefreshTier
+    # Время с последнего успешного обновления, None - группа еще не обновлялась
+    age: Optional[timedelta]
+
+    @property
+    def overdue(self) -> float:
+        """Возраст данных в долях SLA уровня; больше 1 - SLA нарушен"""
+        if self.age is None:
+            return float('inf')
+        return self.age / self.tier.max_age
+
+
+class RefreshScheduler:
+    """
+    Выбирает группы для обновления расписания по приоритету.
+    Оценка группы складывается из частоты недавних изменений расписания
+    (изменения ближайших недель весят больше) и спроса из таблицы group_demand.
+    По оценке группа попадает в уровень со своим SLA свежести; в проход берутся
+    группы, у которых SLA истекает, в порядке наибольшей просрочки
+    """
+
+    def __init__(self, db_manager, tiers: List[RefreshTier] = None, change_window_days: int = 28,
+                 change_half_life_days: float = 7.0, demand_weight: float = 1.0):
+        self.db_manager = db_manager
+        self.tiers = sorted(tiers or DEFAULT_TIERS, key=lambda tier: tier.min_score, reverse=True)
+        self.change_window_days = change_window_days
+        self.change_half_life_days = change_half_life_days
+        self.demand_weight = demand_weight
+
+    def __tier_for(self, score: float) -> RefreshTier:
+        for tier in self.tiers:
+            if score >= tier.min_score:
+                return tier
+        return self.tiers[-1]
+
+    def priorities(self) -> List[GroupPriority]:
+        """Оценивает все группы одним запросом"""
+        # Каждое изменение затухает с периодом полураспада change_half_life_days
+        # и делится на удаленность измененной недели от сегодняшней в неделях
+        with self.db_manager.get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute("""
+                DELETE FROM schedule_week_changes
+                WHERE changed_at < NOW() - %s * INTERVAL '1 day'
+            """, (self.change_window_days,))
+            cursor.execute("""
+                SELECT g.id,
+                       COALESCE(c.change_score, 0),
+                       COALESCE(d.views, 0),
+                       EXTRACT(EPOCH FROM NOW() - r.last_refreshed_at)
+                FROM groups g
+                LEFT JOIN (
+                    SELECT group_id,
+                           SUM(
+                               POWER(0.5, EXTRACT(EPOCH FROM NOW() - changed_at) / (86400.0 * %s))
+                               / (1 + ABS(week_start - CURRENT_DATE) / 7.0)
+                           ) AS change_score
+                    FROM schedule_week_changes
+                    GROUP BY group_id
+                ) c ON c.group_id = g.id
+                LEFT JOIN group_demand d ON d.group_id = g.id
+                LEFT JOIN group_refresh_state r ON r.group_id = g.id
+                ORDER BY g.id
+            """, (self.change_half_life_days,))
+            rows = cursor.fetchall()
+            connection.commit()
+
+        priorities = []
+        for group_id, change_score, views, age_seconds in rows:
+            score = float(change_score) + self.demand_weight * math.log1p(views)
+            age = timedelta(seconds=float(age_seconds)) if age_seconds is not None else None
+            priorities.append(GroupPriority(group_id, score, self.__tier_for(score), age))
+        return priorities
+
+    def due_groups(self, budget: int = None, lookahead: timedelta = timedelta(minutes=15)) -> List[int]:
+        """
+        Группы, которые нужно обновить в этом проходе: данные устарели или
+        устареют в пределах lookahead. Не больше budget групп, сначала самые просроченные
+        """
+        due = [
+            priority for priority in self.priorities()
+            if priority.age is None or priority.age + lookahead >= priority.tier.max_age
+        ]
+        due.sort(key=lambda priority: (priority.overdue, priority.score), reverse=True)
+        if budget:
+            due = due[:budget]
+
+        if due:
+            self.__save_tiers(due)
+
+        tier_counts = {}
+        for priority in due:
+            tier_counts[priority.tier.name] = tier_counts.get(priority.tier.name, 0) + 1
+        print(f"К обновлению: {len(due)} групп {tier_counts}")
+        return [priority.group_id for priority in due]
+
+    def __save_tiers(self, priorities: List[GroupPriority]):
+        with self.db_manager.get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO group_refresh_state (group_id, tier, score)
+                SELECT * FROM unnest(%s::int[], %s::varchar[], %s::real[])
+                ON CONFLICT (group_id) DO UPDATE SET
+                    tier = EXCLUDED.tier,
+                    score = EXCLUDED.score
+            """, (
+                [priority.group_id for priority in priorities],
+                [priority.tier.name for priority in priorities],
+                [priority.score for priority in priorities],
+            ))
+            connection.commit()
+
+    def mark_refreshed(self, group_id: int, fetched_at: Optional[float] = None):
+        """
+        Отмечает успешное обновление группы. fetched_at - когда данные получены от RUZ
+        (SemesterSchedule.fetched_at): расписание из кеша не свежее момента загрузки в кеш.
+        Более позднее уже записанное время не перезаписывается
+        """
+        with self.db_manager.get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO group_refresh_state (group_id, last_refreshed_at)
+                VALUES (%s, COALESCE(to_timestamp(%s), NOW()))
+                ON CONFLICT (group_id) DO UPDATE SET last_refreshed_at = GREATEST(
+                    group_refresh_state.last_refreshed_at, EXCLUDED.last_refreshed_at
+                )
+            """, (group_id, fetched_at))
+            connection.commit()
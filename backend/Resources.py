@@ -0,0 +1,140 @@
+import argparse
+from dataclasses import dataclass
+from typing import List, Optional
+
+from main import DatabaseManager
+
+
+@dataclass
+class Occupation:
+    date: str
+    start_time: str
+    end_time: str
+    subject: str
+    group_id: int
+    teacher: str
+    auditory: str
+    building: str
+
+
+@dataclass
+class Room:
+    id: int
+    building: str
+    name: str
+
+
+class ResourceQueries:
+    """
+    Запросы по справочникам teachers и rooms: где преподаватель в заданные дни
+    и какие аудитории свободны в интервал. Занятость ищется по индексам
+    (teacher_id|room_id, date, start_time, end_time), без просмотра всего schedule
+    """
+
+    def __init__(self, db_manager: DatabaseManager):
+        self.db_manager = db_manager
+
+    @staticmethod
+    def __occupations(rows) -> List[Occupation]:
+        return [
+            Occupation(day.isoformat(), start_time.strftime('%H:%M'), end_time.strftime('%H:%M'),
+                       subject, group_id, teacher, auditory or '', building or '')
+            for day, start_time, end_time, subject, group_id, teacher, auditory, building in rows
+        ]
+
+    def teacher_schedule(self, full_name: str, date_from: str, date_to: str) -> List[Occupation]:
+        """Занятия преподавателя с date_from по date_to включительно"""
+        with self.db_manager.get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT s.date, s.start_time, s.end_time, s.subject, s.group_id,
+                       s.teacher, s.audithory, s.place
+                FROM teachers t
+                JOIN schedule s ON s.teacher_id = t.id
+                WHERE t.full_name = %s AND s.date BETWEEN %s AND %s
+                ORDER BY s.date, s.start_time
+            """, (full_name, date_from, date_to))
+            rows = cursor.fetchall()
+            connection.rollback()
+        return self.__occupations(rows)
+
+    def room_schedule(self, building: str, name: str, date: str) -> List[Occupation]:
+        """Занятия в аудитории за день"""
+        with self.db_manager.get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT s.date, s.start_time, s.end_time, s.subject, s.group_id,
+                       s.teacher, s.audithory, s.place
+                FROM rooms r
+                JOIN schedule s ON s.room_id = r.id
+                WHERE r.building = %s AND r.name = %s AND s.date = %s
+                ORDER BY s.start_time
+            """, (building, name, date))
+            rows = cursor.fetchall()
+            connection.rollback()
+        return self.__occupations(rows)
+
+    def free_rooms(self, date: str, start_time: str, end_time: str,
+                   building: Optional[str] = None) -> List[Room]:
+        """Аудитории, в которых нет занятий, пересекающихся с интервалом [start_time, end_time)"""
+        with self.db_manager.get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT r.id, r.building, r.name
+                FROM rooms r
+                WHERE (%s::text IS NULL OR r.building = %s)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM schedule s
+                      WHERE s.room_id = r.id AND s.date = %s
+                        AND s.start_time < %s AND s.end_time > %s
+                  )
+                ORDER BY r.building, r.name
+            """, (building, building, date, end_time, start_time))
+            rows = cursor.fetchall()
+            connection.rollback()
+        return [Room(*row) for row in rows]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Поиск по преподавателям и аудиториям")
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+
+    teacher_parser = subparsers.add_parser('teacher', help="занятия преподавателя")
+    teacher_parser.add_argument('full_name')
+    teacher_parser.add_argument('--from', dest='date_from', required=True)
+    teacher_parser.add_argument('--to', dest='date_to', required=True)
+
+    room_parser = subparsers.add_parser('room', help="занятия в аудитории за день")
+    room_parser.add_argument('name')
+    room_parser.add_argument('--building', default='')
+    room_parser.add_argument('--date', required=True)
+
+    free_parser = subparsers.add_parser('free-rooms', help="свободные аудитории")
+    free_parser.add_argument('--date', required=True)
+    free_parser.add_argument('--start', required=True)
+    free_parser.add_argument('--end', required=True)
+    free_parser.add_argument('--building')
+    args = arg_parser.parse_args()
+
+    db_manager = DatabaseManager()
+    if not db_manager.connect():
+        print("Не удалось подключиться к базе данных")
+        return
+
+    try:
+        queries = ResourceQueries(db_manager)
+        if args.command == 'free-rooms':
+            for room in queries.free_rooms(args.date, args.start, args.end, args.building):
+                print(f"{room.building} {room.name}".strip())
+            return
+
+        if args.command == 'teacher':
+            occupations = queries.teacher_schedule(args.full_name, args.date_from, args.date_to)
+        else:
+            occupations = queries.room_schedule(args.building, args.name, args.date)
+        for occupation in occupations:
+            print(f"{occupation.date} {occupation.start_time}-{occupation.end_time} {occupation.subject} "
+                  f"(группа {occupation.group_id}, {occupation.teacher}, {occupation.building} {occupation.auditory})")
+    finally:
+        db_manager.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, Any, Optional
+
+
+@dataclass
+class CachedResponse:
+    data: Any
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+    ttl: float
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.time() - self.fetched_at < self.ttl
+
+
+class ResponseCache(ABC):
+    """
+    Интерфейс кеша ответов API. Ключ записи - endpoint и параметры запроса
+    """
+
+    # Время жизни записей по endpoint (регулярное выражение -> секунды)
+    DEFAULT_TTLS = {
+        r'^faculties$': 7 * 24 * 3600,
+        r'^faculties/\d+/groups$': 24 * 3600,
+        r'^scheduler/\d+$': 6 * 3600,
+    }
+
+    def __init__(self, ttls: Optional[Dict[str, float]] = None, default_ttl: float = 3600):
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in (ttls or self.DEFAULT_TTLS).items()]
+        self.default_ttl = default_ttl
+
+    def ttl_for(self, endpoint: str) -> float:
+        for pattern, ttl in self.ttls:
+            if pattern.match(endpoint):
+                return ttl
+        return self.default_ttl
+
+    @staticmethod
+    def make_key(endpoint: str, params: Optional[Dict] = None) -> str:
+        return f"{endpoint}?{json.dumps(params or {}, sort_keys=True)}"
+
+    @abstractmethod
+    def get(self, endpoint: str, params: Optional[Dict] = None) -> Optional[CachedResponse]:
+        ...
+
+    @abstractmethod
+    def put(self, endpoint: str, params: Optional[Dict], data: Any,
+            etag: Optional[str] = None, last_modified: Optional[str] = None):
+        ...
+
+    @abstractmethod
+    def touch(self, endpoint: str, params: Optional[Dict] = None):
+        """Продлевает запись после ответа 304 Not Modified"""
+
+
+class SQLiteResponseCache(ResponseCache):
+    """
+    Кеш ответов в SQLite-файле с вытеснением давно не использованных записей (LRU)
+    при превышении max_bytes.
+    Чтение из кеша ничего не пишет на диск: время обращения копится в памяти
+    и записывается вместе со следующей записью или пачкой по access_flush_size.
+    Общий размер кеша считается один раз при открытии и дальше ведется в памяти
+    """
+
+    def __init__(self, path: str = 'ruz_cache.sqlite3', max_bytes: int = 200 * 1024 * 1024,
+                 ttls: Optional[Dict[str, float]] = None, default_ttl: float = 3600,
+                 access_flush_size: int = 500):
+        super().__init__(ttls, default_ttl)
+        self.max_bytes = max_bytes
+        self.access_flush_size = access_flush_size
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        # WAL: запись не блокирует чтение и не требует синхронизации диска на каждый commit
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                body TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed_at ON responses (accessed_at)")
+        self.connection.commit()
+        self.total_size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        # Ключ -> время последнего обращения, еще не записанное в файл
+        self.pending_access: Dict[str, float] = {}
+
+    def get(self, endpoint: str, params: Optional[Dict] = None) -> Optional[CachedResponse]:
+        key = self.make_key(endpoint, params)
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT body, etag, last_modified, fetched_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if not row:
+                return None
+            self.pending_access[key] = time.time()
+            if len(self.pending_access) >= self.access_flush_size:
+                self.__flush_access()
+                self.connection.commit()
+
+        body, etag, last_modified, fetched_at = row
+        return CachedResponse(
+            data=json.loads(body),
+            etag=etag,
+            last_modified=last_modified,
+            fetched_at=fetched_at,
+            ttl=self.ttl_for(endpoint)
+        )
+
+    def put(self, endpoint: str, params: Optional[Dict], data: Any,
+            etag: Optional[str] = None, last_modified: Optional[str] = None):
+        key = self.make_key(endpoint, params)
+        body = json.dumps(data, ensure_ascii=False)
+        now = time.time()
+        with self.lock:
+            self.__flush_access()
+            self.pending_access.pop(key, None)
+            old_row = self.connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.connection.execute("""
+                INSERT OR REPLACE INTO responses
+                (key, endpoint, body, etag, last_modified, fetched_at, accessed_at, size)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (key, endpoint, body, etag, last_modified, now, now, len(body)))
+            self.total_size += len(body) - (old_row[0] if old_row else 0)
+            if self.total_size > self.max_bytes:
+                self.__evict()
+            self.connection.commit()
+
+    def touch(self, endpoint: str, params: Optional[Dict] = None):
+        key = self.make_key(endpoint, params)
+        now = time.time()
+        with self.lock:
+            self.__flush_access()
+            self.pending_access.pop(key, None)
+            self.connection.execute(
+                "UPDATE responses SET fetched_at = ?, accessed_at = ? WHERE key = ?",
+                (now, now, key)
+            )
+            self.connection.commit()
+
+    def flush(self):
+        """Записывает накопленные времена обращений (например, перед завершением)"""
+        with self.lock:
+            self.__flush_access()
+            self.connection.commit()
+
+    def __flush_access(self):
+        if self.pending_access:
+            self.connection.executemany(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self.pending_access.items()]
+            )
+            self.pending_access = {}
+
+    def __evict(self):
+        """Удаляет самые давно использованные записи, пока кеш больше max_bytes"""
+        rows = self.connection.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+        evicted_keys = []
+        for key, size in rows:
+            if self.total_size <= self.max_bytes:
+                break
+            evicted_keys.append((key,))
+            self.total_size -= size
+        self.connection.executemany("DELETE FROM responses WHERE key = ?", evicted_keys)
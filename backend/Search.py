@@ -0,0 +1,57 @@
+import argparse
+from dataclasses import dataclass
+from typing import List, Optional
+
+from main import DatabaseManager
+
+
+@dataclass
+class SearchResult:
+    # 'event' - событие календаря, 'lesson' - занятие расписания
+    kind: str
+    id: int
+    title: str
+    date: str
+    start_time: Optional[str]
+    rank: float
+
+
+def search(db_manager: DatabaseManager, query: str, group_id: Optional[int] = None,
+           limit: int = 20) -> List[SearchResult]:
+    """
+    Ранжированный поиск по событиям календаря и предстоящим занятиям через
+    функцию БД search_planner (ее же вызывают клиенты через RPC Supabase)
+    """
+    with db_manager.get_connection() as connection, connection.cursor() as cursor:
+        cursor.execute("SELECT * FROM search_planner(%s, %s, %s)", (query, group_id, limit))
+        rows = cursor.fetchall()
+        connection.rollback()
+
+    return [
+        SearchResult(kind, result_id, title, day.isoformat(),
+                     start_time.strftime('%H:%M') if start_time else None, rank)
+        for kind, result_id, title, day, start_time, rank in rows
+    ]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Поиск по событиям календаря и занятиям")
+    arg_parser.add_argument('query')
+    arg_parser.add_argument('--group', type=int, help="искать занятия только этой группы")
+    arg_parser.add_argument('--limit', type=int, default=20)
+    args = arg_parser.parse_args()
+
+    db_manager = DatabaseManager()
+    if not db_manager.connect():
+        print("Не удалось подключиться к базе данных")
+        return
+
+    try:
+        for result in search(db_manager, args.query, args.group, args.limit):
+            print(f"{result.rank:.3f} [{result.kind}] {result.date} {result.start_time or ''} {result.title}")
+    finally:
+        db_manager.disconnect()
+
+
+if __name__ == "__main__":
+    main()
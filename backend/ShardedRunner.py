@@ -0,0 +1,262 @@
+import argparse
+import multiprocessing
+import socket
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+from Crawler import ScheduleCrawler, CrawlResult
+from Migrations import MigrationManager
+from ParserSched import SchedulerParser
+from RateLimiter import AdaptiveRateLimiter
+from ResponseCache import SQLiteResponseCache
+from main import DatabaseManager
+
+
+class GroupLeaseQueue:
+    """
+    Очередь групп в таблице group_sync_leases, общая для всех процессов и хостов.
+    Группы выдаются пачками через SELECT ... FOR UPDATE SKIP LOCKED: два обработчика
+    не получат одну группу, а группа упавшего обработчика вернется в очередь,
+    когда истечет его аренда. Методы mark_done/mark_failed совпадают с SyncLedger
+    """
+
+    PENDING = 'pending'
+    LEASED = 'leased'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, db_manager: DatabaseManager, worker_id: str, lease_seconds: int = 300,
+                 batch_size: int = 8, shard_index: int = None, shard_count: int = None, max_attempts: int = 3):
+        self.db_manager = db_manager
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.batch_size = batch_size
+        # Свой шард по хешу (group_id % shard_count) выдается первым,
+        # чужие группы забираются, только когда свой шард закончился
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.max_attempts = max_attempts
+        # Ошибка последней аренды: обход прекращается, а не считается завершенным
+        self.claim_error: Optional[Exception] = None
+
+    def start(self, group_ids: List[int]):
+        """Начинает новый проход: все группы становятся ожидающими"""
+        with self.db_manager.get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO group_sync_leases (group_id, status)
+                SELECT unnest(%s::int[]), %s
+                ON CONFLICT (group_id) DO UPDATE SET
+                    status = EXCLUDED.status,
+                    worker = NULL,
+                    lease_until = NULL,
+                    attempts = 0,
+                    error = NULL,
+                    updated_at = NOW()
+            """, (group_ids, self.PENDING))
+            connection.commit()
+
+    def claim(self) -> List[int]:
+        """Арендует следующую пачку ожидающих групп или групп с истекшей арендой"""
+        if self.shard_count:
+            order_by = "(group_id %% %s <> %s), group_id"
+            order_params = (self.shard_count, self.shard_index)
+        else:
+            order_by = "group_id"
+            order_params = ()
+
+        with self.db_manager.get_connection() as connection, connection.cursor() as cursor:
+            # Группа, аренда которой истекала max_attempts раз (обработчик падает на ней
+            # или не успевает за lease_seconds), больше не выдается
+            cursor.execute("""
+                UPDATE group_sync_leases
+                SET status = %s, error = %s, lease_until = NULL, updated_at = NOW()
+                WHERE group_id IN (
+                    SELECT group_id FROM group_sync_leases
+                    WHERE status = %s AND lease_until < NOW() AND attempts >= %s
+                    FOR UPDATE SKIP LOCKED
+                )
+            """, (self.FAILED, f"аренда истекла {self.max_attempts} раз", self.LEASED, self.max_attempts))
+            cursor.execute(f"""
+                UPDATE group_sync_leases
+                SET status = %s, worker = %s, lease_until = NOW() + %s * INTERVAL '1 second',
+                    attempts = attempts + 1, updated_at = NOW()
+                WHERE group_id IN (
+                    SELECT group_id FROM group_sync_leases
+                    WHERE (status = %s OR (status = %s AND lease_until < NOW() AND attempts < %s)
+                           OR (status = %s AND attempts < %s))
+                    ORDER BY {order_by}
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING group_id
+            """, (self.LEASED, self.worker_id, self.lease_seconds,
+                  self.PENDING, self.LEASED, self.max_attempts, self.FAILED, self.max_attempts,
+                  *order_params, self.batch_size))
+            group_ids = sorted(row[0] for row in cursor.fetchall())
+            connection.commit()
+            return group_ids
+
+    def iter_group_ids(self) -> Iterator[int]:
+        """
+        Выдает группы по одной, арендуя новую пачку, когда предыдущая разобрана.
+        Ошибка аренды останавливает выдачу и сохраняется в claim_error
+        """
+        while True:
+            try:
+                group_ids = self.claim()
+            except Exception as e:
+                print(f"[{self.worker_id}] Ошибка аренды групп: {e}")
+                self.claim_error = e
+                return
+            if not group_ids:
+                return
+            yield from group_ids
+
+    def __finish(self, group_id: int, status: str, error: Optional[str] = None):
+        # Если аренда истекла и группу забрал другой обработчик, статус не трогаем
+        with self.db_manager.get_connection() as connection, connection.cursor() as cursor:
+            cursor.execute("""
+                UPDATE group_sync_leases
+                SET status = %s, error = %s, lease_until = NULL, updated_at = NOW()
+                WHERE group_id = %s AND worker = %s
+            """, (status, error, group_id, self.worker_id))
+            connection.commit()
+
+    def mark_done(self, group_id: int, fingerprint: Optional[str] = None):
+        self.__finish(group_id, self.DONE)
+
+    def mark_failed(self, group_id: int, error: str):
+        self.__finish(group_id, self.FAILED, error)
+
+
+def run_worker(worker_id: str, rps: float, max_workers: int, lease_seconds: int, batch_size: int,
+               shard_index: int = None, shard_count: int = None):
+    """
+    Обработчик одного процесса: арендует группы, пока они есть, загружает их
+    расписание и записывает в БД. Парсер и соединения создаются внутри процесса
+    """
+    scheduler_parser = SchedulerParser(
+        rate_limiter=AdaptiveRateLimiter(rate=min(5.0, rps), max_rate=rps),
+        # У каждого процесса свой файл кеша, чтобы не ждать блокировку SQLite
+        response_cache=SQLiteResponseCache(path=f'ruz_cache_{worker_id}.sqlite3')
+    )
+    db_manager = DatabaseManager()
+    db_manager.max_connections = 2
+
+    if not db_manager.connect():
+        print(f"[{worker_id}] Не удалось подключиться к базе данных")
+        return
+
+    leases = GroupLeaseQueue(db_manager, worker_id, lease_seconds=lease_seconds, batch_size=batch_size,
+                             shard_index=shard_index, shard_count=shard_count)
+    total_lessons = 0
+    successful_groups = 0
+    failed_groups = 0
+
+    def on_result(i: int, result: CrawlResult):
+        nonlocal total_lessons, successful_groups, failed_groups
+        if result.error or result.semester_schedule is None:
+            # Неделя не загрузилась: группа не считается обработанной и вернется
+            # в очередь через статус failed (пока attempts < max_attempts)
+            failed_groups += 1
+            print(f"[{worker_id}] ❌ Группа {result.group_id}: ошибка загрузки - {result.error}")
+            leases.mark_failed(result.group_id, f"ошибка загрузки: {result.error}")
+            return
+
+        try:
+            if result.semester_schedule.weeks:
+                lessons_count = db_manager.insert_semester_schedule(result.semester_schedule, result.group_id)
+                if lessons_count is None:
+                    raise RuntimeError("не удалось записать расписание в БД")
+                total_lessons += lessons_count
+
+            successful_groups += 1
+            leases.mark_done(result.group_id)
+        except Exception as e:
+            failed_groups += 1
+            print(f"[{worker_id}] ❌ Группа {result.group_id}: ошибка - {e}")
+            leases.mark_failed(result.group_id, str(e))
+
+    try:
+        crawler = ScheduleCrawler(scheduler_parser, max_workers=max_workers)
+        crawler.crawl(leases.iter_group_ids(), start_date=datetime.now().strftime('%Y-%m-%d'),
+                      max_weeks=6, on_result=on_result)
+    finally:
+        db_manager.disconnect()
+        scheduler_parser.response_cache.flush()
+
+    if leases.claim_error:
+        # Оставшиеся группы не обработаны этим обработчиком: их заберут другие
+        # после истечения аренды или следующий запуск
+        print(f"[{worker_id}] Остановлен из-за ошибки аренды: {successful_groups} групп, "
+              f"{failed_groups} с ошибками, {total_lessons} занятий записано")
+        return
+
+    print(f"[{worker_id}] Готово: {successful_groups} групп, {failed_groups} с ошибками, "
+          f"{total_lessons} занятий записано")
+
+
+def seed(db_manager: DatabaseManager) -> bool:
+    """Применяет миграции и ставит все группы в очередь нового прохода"""
+    if not db_manager.connect() or not MigrationManager(db_manager).migrate():
+        return False
+
+    group_ids = db_manager.get_all_group_ids()
+    if not group_ids:
+        print("Не найдено групп в базе данных")
+        return False
+
+    GroupLeaseQueue(db_manager, worker_id='seed').start(group_ids)
+    print(f"В очередь поставлено {len(group_ids)} групп")
+    return True
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Параллельная загрузка расписаний несколькими процессами или хостами через общую очередь в БД"
+    )
+    arg_parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                            help="число процессов-обработчиков на этом хосте")
+    arg_parser.add_argument('--seed', action='store_true',
+                            help="начать новый проход (выполняется на одном хосте)")
+    arg_parser.add_argument('--rps', type=float, default=30.0,
+                            help="ограничение запросов к RUZ в секунду на хост, делится между процессами")
+    arg_parser.add_argument('--threads', type=int, default=4, help="потоков загрузки в каждом процессе")
+    arg_parser.add_argument('--lease-seconds', type=int, default=300)
+    arg_parser.add_argument('--batch-size', type=int, default=8, help="групп в одной аренде")
+    arg_parser.add_argument('--shard', help="свой шард по хешу в виде i/n, например 0/3")
+    args = arg_parser.parse_args()
+
+    if args.seed:
+        db_manager = DatabaseManager()
+        try:
+            if not seed(db_manager):
+                return
+        finally:
+            db_manager.disconnect()
+
+    # Шард хоста делится между его процессами: процесс k получает шард index * processes + k
+    shard_index, shard_count = None, None
+    if args.shard:
+        host_index, host_count = (int(part) for part in args.shard.split('/'))
+        shard_count = host_count * args.processes
+
+    host = socket.gethostname()
+    processes = []
+    for k in range(args.processes):
+        if args.shard:
+            shard_index = host_index * args.processes + k
+        process = multiprocessing.Process(
+            target=run_worker,
+            args=(f"{host}-{k}", args.rps / args.processes, args.threads,
+                  args.lease_seconds, args.batch_size, shard_index, shard_count)
+        )
+        process.start()
+        processes.append(process)
+
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
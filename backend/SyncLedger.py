@@ -0,0 +1,76 @@
+import sqlite3
+import time
+from typing import List, Optional
+
+
+class SyncLedger:
+    """
+    Журнал полной синхронизации расписаний в локальном SQLite-файле.
+    Хранит статус каждой группы в текущем проходе, чтобы после сбоя
+    продолжить с места остановки или повторить только неудачные группы
+    """
+
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, path: str = 'sync_ledger.sqlite3'):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS group_sync (
+                group_id INTEGER PRIMARY KEY,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_attempt REAL,
+                fingerprint TEXT,
+                error TEXT
+            )
+        """)
+        self.connection.commit()
+
+    def start(self, group_ids: List[int]):
+        """Начинает новый проход: все группы становятся ожидающими"""
+        self.connection.execute("UPDATE group_sync SET status = ?, attempts = 0, error = NULL", (self.PENDING,))
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO group_sync (group_id, status) VALUES (?, ?)",
+            [(group_id, self.PENDING) for group_id in group_ids]
+        )
+        self.connection.commit()
+
+    def pending_groups(self, group_ids: List[int], only_failed: bool = False) -> List[int]:
+        """
+        Возвращает группы, которые нужно обработать при возобновлении прохода:
+        все незавершенные или только неудачные
+        """
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO group_sync (group_id, status) VALUES (?, ?)",
+            [(group_id, self.PENDING) for group_id in group_ids]
+        )
+        self.connection.commit()
+
+        if only_failed:
+            rows = self.connection.execute("SELECT group_id FROM group_sync WHERE status = ?", (self.FAILED,))
+        else:
+            rows = self.connection.execute("SELECT group_id FROM group_sync WHERE status != ?", (self.DONE,))
+        selected = {row[0] for row in rows}
+        return [group_id for group_id in group_ids if group_id in selected]
+
+    def mark_done(self, group_id: int, fingerprint: Optional[str] = None):
+        self.connection.execute("""
+            UPDATE group_sync
+            SET status = ?, attempts = attempts + 1, last_attempt = ?,
+                fingerprint = COALESCE(?, fingerprint), error = NULL
+            WHERE group_id = ?
+        """, (self.DONE, time.time(), fingerprint, group_id))
+        self.connection.commit()
+
+    def mark_failed(self, group_id: int, error: str):
+        self.connection.execute("""
+            UPDATE group_sync
+            SET status = ?, attempts = attempts + 1, last_attempt = ?, error = ?
+            WHERE group_id = ?
+        """, (self.FAILED, time.time(), error, group_id))
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
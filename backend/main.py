@@ -1,37 +1,95 @@
-import random
+import argparse
 
 import psycopg2
-from datetime import datetime, timedelta
-from typing import List
+from datetime import datetime, timedelta, date
+from typing import List, Optional, Dict, Any
 import time
 import socket
+import threading
 from psycopg2 import OperationalError, InterfaceError
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from contextlib import contextmanager
 
-from ParserCal import GoogleCalendarParser, CalendarEvent
+from ParserCal import GoogleCalendarParser, CalendarEvent, CalendarChanges, CalendarSyncState
 from ParserSched import SchedulerParser, Week, Lesson, Faculty, Group, SemesterSchedule
+from Crawler import ScheduleCrawler, CrawlResult
+from RateLimiter import AdaptiveRateLimiter
+from ResponseCache import SQLiteResponseCache
+from SyncLedger import SyncLedger
+from Metrics import metrics
+from Migrations import MigrationManager
+from RefreshScheduler import RefreshScheduler
+from ReadModel import SnapshotBuilder
+from Conflicts import ConflictEngine
+
+
+class MetricsCursor(psycopg2.extensions.cursor):
+    """Курсор, считающий выполненные запросы, их длительность и число записанных строк"""
+
+    def execute(self, query, vars=None):
+        sql = query.decode() if isinstance(query, bytes) else str(query)
+        operation = sql.split(None, 1)[0].upper() if sql.strip() else 'UNKNOWN'
+        with metrics.timer('db_statement_seconds', operation=operation):
+            result = super().execute(query, vars)
+        metrics.inc('db_statements_total', operation=operation)
+        if operation in ('INSERT', 'UPDATE', 'DELETE') and self.rowcount > 0:
+            metrics.inc('db_rows_written_total', self.rowcount, operation=operation)
+        return result
+
+
+class MetricsConnection(psycopg2.extensions.connection):
+    """Соединение, считающее коммиты и их длительность"""
+
+    def cursor(self, *args, **kwargs):
+        kwargs.setdefault('cursor_factory', MetricsCursor)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        with metrics.timer('db_commit_seconds'):
+            super().commit()
+        metrics.inc('db_commits_total')
 
 
 class DatabaseManager:
-    def __init__(self):
-        self.db_config = {
+    def __init__(self, db_config: Optional[Dict[str, Any]] = None, sslmode: str = 'require'):
+        self.db_config = db_config or {
             'host': 'aws-1-eu-north-1.pooler.supabase.com',
             'port': 5432,
             'database': 'postgres',
             'user': 'postgres.pjcbyabqlgpjvkozojvc',
             'password': '*',
         }
-        self.connection = None
+        self.sslmode = sslmode
+        # Пул соединений, общий для потоков
+        self.pool = None
+        self.max_connections = 8
         self.max_retries = 3
         self.retry_delay = 2
+        # Размер страницы для многострочных INSERT
+        self.batch_size = 500
+        # Удалять занятия, которые исчезли из RUZ, в пределах загруженных недель
+        self.reconcile = True
+        # Статистика по неделям расписания: пропущено без изменений, изменено, новых,
+        # а также число удаленных устаревших занятий
+        self.week_stats = {'skipped': 0, 'changed': 0, 'new': 0, 'stale_lessons': 0}
+        self.stats_lock = threading.Lock()
 
     def connect(self):
         try:
             ssl_config = {
-                'sslmode': 'require',
+                'sslmode': self.sslmode,
             }
-            full_config = {**self.db_config, **ssl_config}
-            self.connection = psycopg2.connect(**full_config)
-            self.connection.autocommit = False
+            # keepalive, чтобы пулер не обрывал простаивающие соединения пула незаметно
+            keepalive_config = {
+                'keepalives': 1,
+                'keepalives_idle': 30,
+                'keepalives_interval': 10,
+                'keepalives_count': 3,
+            }
+            full_config = {**self.db_config, **ssl_config, **keepalive_config}
+            self.pool = ThreadedConnectionPool(1, self.max_connections, connection_factory=MetricsConnection,
+                                               **full_config)
             print("Успешное подключение к Supabase через session pooler")
             return True
         except Exception as e:
@@ -46,53 +104,39 @@ class DatabaseManager:
         return self.connect()
 
     def ensure_connection(self):
-        """Проверяет соединение и переподключается при необходимости"""
+        """
+        Проверяет, что пул соединений создан. Живость соединений не проверяется запросом:
+        оборванное соединение выбрасывается из пула при первой ошибке в get_connection
+        """
+        if self.pool and not self.pool.closed:
+            return True
+        return self.reconnect()
+
+    @contextmanager
+    def get_connection(self):
+        """
+        Выдает соединение из пула и возвращает его обратно. Незакоммиченная транзакция
+        откатывается пулом, соединение с сетевой ошибкой закрывается и не переиспользуется
+        """
+        connection = self.pool.getconn()
+        broken = False
         try:
-            if self.connection and not self.connection.closed:
-                with self.connection.cursor() as cursor:
-                    cursor.execute("SELECT 1")
-                return True
-            else:
-                return self.reconnect()
+            yield connection
         except (OperationalError, InterfaceError):
-            return self.reconnect()
+            broken = True
+            raise
+        finally:
+            self.pool.putconn(connection, close=broken or bool(connection.closed))
 
     def disconnect(self):
-        if self.connection:
+        if self.pool:
             try:
-                self.connection.close()
+                self.pool.closeall()
                 print("Отключение от Supabase")
             except:
                 pass
             finally:
-                self.connection = None
-
-    def add_place_column_to_schedule(self):
-        """Добавляет поле place в таблицу schedule, если его нет"""
-        if not self.ensure_connection():
-            print("Не удалось подключиться для добавления поля place")
-            return False
-
-        try:
-            with self.connection.cursor() as cursor:
-                # Проверяем, существует ли уже поле place
-                cursor.execute("""
-                    SELECT column_name
-                    FROM information_schema.columns
-                    WHERE table_name = 'schedule' AND column_name = 'place'
-                """)
-                if not cursor.fetchone():
-                    # Добавляем поле place
-                    cursor.execute("ALTER TABLE schedule ADD COLUMN place VARCHAR(100)")
-                    self.connection.commit()
-                    print("Поле place успешно добавлено в таблицу schedule")
-                else:
-                    print("Поле place уже существует в таблице schedule")
-                return True
-        except Exception as e:
-            print(f"Ошибка добавления поля place: {e}")
-            self.connection.rollback()
-            return False
+                self.pool = None
 
     def check_calendar_event_exists(self, event: CalendarEvent) -> bool:
         """Проверяет, существует ли уже такое событие в календаре"""
@@ -105,7 +149,7 @@ class DatabaseManager:
         """
 
         try:
-            with self.connection.cursor() as cursor:
+            with self.get_connection() as connection, connection.cursor() as cursor:
                 cursor.execute(check_sql, (
                     event.title,
                     event.date,
@@ -119,149 +163,372 @@ class DatabaseManager:
             print(f"Ошибка проверки события календаря: {e}")
             return False
 
-    def insert_calendar_events(self, events: List[CalendarEvent]):
-        if not self.ensure_connection():
-            print("Не удалось подключиться к БД для вставки событий календаря")
-            return
-
-        if not events:
-            print("Нет событий для вставки в календарь")
-            return
+    def __upsert_calendar_events(self, cursor, events: List[CalendarEvent], chunk_size: int):
+        """Многострочный UPSERT событий, не более chunk_size событий в одном запросе"""
+        # Убираем повторы по ключу unique_calendar_event, иначе ON CONFLICT упадет
+        rows = {}
+        for event in events:
+            key = (event.title, event.date, event.start_time, event.end_time, event.calendar_name)
+            rows[key] = (
+                event.title,
+                event.description,
+                event.date,
+                event.start_time,
+                event.end_time,
+                event.location,
+                event.creator,
+                event.calendar_name,
+                event.event_id or None
+            )
 
         # Используем UPSERT для обновления существующих записей
         upsert_sql = """
         INSERT INTO calendar_events
-        (title, description, date, start_time, end_time, location, creator, calendar_name)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        (title, description, date, start_time, end_time, location, creator, calendar_name, event_id)
+        VALUES %s
         ON CONFLICT (title, date, start_time, end_time, calendar_name)
         DO UPDATE SET
             description = EXCLUDED.description,
             location = EXCLUDED.location,
-            creator = EXCLUDED.creator
+            creator = EXCLUDED.creator,
+            event_id = COALESCE(EXCLUDED.event_id, calendar_events.event_id)
+        RETURNING (xmax = 0)
         """
 
-        try:
-            with self.connection.cursor() as cursor:
-                inserted_count = 0
-                updated_count = 0
+        results = execute_values(cursor, upsert_sql, list(rows.values()), page_size=chunk_size, fetch=True)
+        inserted_count = sum(1 for (inserted,) in results if inserted)
+        return inserted_count, len(results) - inserted_count
 
-                for event in events:
-                    # Проверяем, существует ли уже такое событие
-                    cursor.execute("""
-                        SELECT COUNT(*) FROM calendar_events
-                        WHERE title = %s AND date = %s AND start_time = %s AND end_time = %s AND calendar_name = %s
-                    """, (
-                        event.title,
-                        event.date,
-                        event.start_time,
-                        event.end_time,
-                        event.calendar_name
-                    ))
-                    exists = cursor.fetchone()[0] > 0
-
-                    cursor.execute(upsert_sql, (
-                        event.title,
-                        event.description,
-                        event.date,
-                        event.start_time,
-                        event.end_time,
-                        event.location,
-                        event.creator,
-                        event.calendar_name
-                    ))
-
-                    if exists:
-                        updated_count += 1
-                    else:
-                        inserted_count += 1
-
-                self.connection.commit()
+    def insert_calendar_events(self, events: List[CalendarEvent], chunk_size: int = 1000):
+        """
+        Вставляет или обновляет события календаря многострочным UPSERT,
+        не более chunk_size событий в одном запросе
+        """
+        if not self.ensure_connection():
+            print("Не удалось подключиться к БД для вставки событий календаря")
+            return False
+
+        if not events:
+            print("Нет событий для вставки в календарь")
+            return True
+
+        try:
+            with self.get_connection() as connection, connection.cursor() as cursor:
+                inserted_count, updated_count = self.__upsert_calendar_events(cursor, events, chunk_size)
+                self.__mark_conflict_days(cursor, 0, sorted({event.date for event in events}))
+                connection.commit()
                 print(f"Календарь: добавлено {inserted_count} новых событий, обновлено {updated_count} существующих")
+                return True
 
         except Exception as e:
             print(f"Ошибка вставки событий календаря: {e}")
-            self.connection.rollback()
+            return False
+
+    def __mark_conflict_days(self, cursor, group_id: int, dates: List[date]):
+        """Ставит дни в очередь пересчета пересечений (group_id = 0 - для всех групп)"""
+        dates = [day for day in dates if day]
+        if dates:
+            cursor.execute("""
+                INSERT INTO conflict_dirty_days (group_id, date)
+                SELECT %s, unnest(%s::date[])
+                ON CONFLICT DO NOTHING
+            """, (group_id, dates))
+
+    def apply_calendar_changes(self, changes: CalendarChanges, chunk_size: int = 1000):
+        """
+        Применяет изменения календарей одной транзакцией: удаляет отмененные события
+        и старые версии перенесенных, затем вставляет или обновляет остальные.
+        После полной загрузки календаря удаляются и все его строки периода, которых нет в загрузке
+        """
+        if not self.ensure_connection():
+            print("Не удалось подключиться к БД для применения изменений календаря")
+            return False
+
+        # Отмененные события удаляются целиком
+        delete_cancelled_sql = """
+        DELETE FROM calendar_events c
+        USING (VALUES %s) AS v(calendar_name, event_id)
+        WHERE c.calendar_name = v.calendar_name AND c.event_id = v.event_id
+        RETURNING c.date
+        """
+
+        # У перенесенного события меняется ключ, поэтому старые строки остаются под тем же event_id.
+        # Многодневное событие занимает несколько строк, поэтому удаляются строки event_id,
+        # которых нет среди новых строк этого события. Все строки передаются одним запросом
+        # типизированными массивами, чтобы строки одного события не разошлись по страницам
+        delete_moved_sql = """
+        DELETE FROM calendar_events c
+        USING (
+            SELECT DISTINCT calendar_name, event_id FROM unnest(%(calendar_names)s::text[], %(event_ids)s::text[])
+                AS k(calendar_name, event_id)
+        ) k
+        WHERE c.calendar_name = k.calendar_name AND c.event_id = k.event_id
+          AND NOT EXISTS (
+              SELECT 1
+              FROM unnest(%(calendar_names)s::text[], %(event_ids)s::text[], %(titles)s::text[],
+                          %(dates)s::date[], %(start_times)s::time[], %(end_times)s::time[])
+                  AS v(calendar_name, event_id, title, date, start_time, end_time)
+              WHERE v.calendar_name = c.calendar_name AND v.event_id = c.event_id
+                AND v.title = c.title AND v.date = c.date
+                AND v.start_time IS NOT DISTINCT FROM c.start_time
+                AND v.end_time IS NOT DISTINCT FROM c.end_time
+          )
+        RETURNING c.date
+        """
+
+        # Строки календаря в полных днях периода, которых нет среди загруженных событий
+        delete_missing_sql = """
+        DELETE FROM calendar_events c
+        WHERE c.calendar_name = %(calendar_name)s
+          AND c.date BETWEEN %(date_from)s AND %(date_to)s
+          AND NOT EXISTS (
+              SELECT 1
+              FROM unnest(%(titles)s::text[], %(dates)s::date[], %(start_times)s::time[], %(end_times)s::time[])
+                  AS v(title, date, start_time, end_time)
+              WHERE v.title = c.title AND v.date = c.date
+                AND v.start_time IS NOT DISTINCT FROM c.start_time
+                AND v.end_time IS NOT DISTINCT FROM c.end_time
+          )
+        RETURNING c.date
+        """
+
+        moved_events = [event for event in changes.events if event.event_id]
+        moved_columns = {
+            'calendar_names': [event.calendar_name for event in moved_events],
+            'event_ids': [event.event_id for event in moved_events],
+            'titles': [event.title for event in moved_events],
+            'dates': [event.date for event in moved_events],
+            'start_times': [event.start_time for event in moved_events],
+            'end_times': [event.end_time for event in moved_events],
+        }
+
+        try:
+            with self.get_connection() as connection, connection.cursor() as cursor:
+                # Даты удаленных и измененных событий: пересечения с занятиями в эти дни пересчитываются
+                deleted_dates = []
+                if changes.full_window:
+                    date_from, date_to = changes.full_window
+                    cursor.execute(delete_missing_sql, {
+                        'calendar_name': changes.calendar_name,
+                        'date_from': date_from,
+                        'date_to': date_to,
+                        'titles': [event.title for event in changes.events],
+                        'dates': [event.date for event in changes.events],
+                        'start_times': [event.start_time for event in changes.events],
+                        'end_times': [event.end_time for event in changes.events],
+                    })
+                    deleted_dates += cursor.fetchall()
+                if changes.cancelled:
+                    deleted_dates += execute_values(cursor, delete_cancelled_sql, list(set(changes.cancelled)),
+                                                    page_size=chunk_size, fetch=True)
+                if moved_events:
+                    cursor.execute(delete_moved_sql, moved_columns)
+                    deleted_dates += cursor.fetchall()
+                deleted_count = len(deleted_dates)
+
+                inserted_count, updated_count = 0, 0
+                if changes.events:
+                    inserted_count, updated_count = self.__upsert_calendar_events(cursor, changes.events, chunk_size)
+
+                changed_dates = {day for (day,) in deleted_dates} | {event.date for event in changes.events}
+                self.__mark_conflict_days(cursor, 0, sorted(changed_dates))
+
+                connection.commit()
+                print(f"Календарь: добавлено {inserted_count} новых событий, обновлено {updated_count} существующих, "
+                      f"удалено {deleted_count}")
+                return True
+
+        except Exception as e:
+            print(f"Ошибка применения изменений календаря: {e}")
+            return False
+
+    def __schedule_rows(self, weeks: List[Week], group_id: int) -> List[tuple]:
+        """Собирает строки для вставки, убирая повторы по уникальному ключу занятия"""
+        rows = {}
+        for week in weeks:
+            for row in week.iter_rows(group_id):
+                # Ключ unique_schedule_lesson: date, start_time, end_time, subject
+                rows[(row[1], row[5], row[6], row[3])] = row
+        return list(rows.values())
+
+    def __delete_stale_lessons(self, cursor, weeks: List[Week], rows: List[tuple], group_id: int) -> int:
+        """
+        Удаляет занятия группы в окнах дат загруженных недель, которых нет среди
+        загруженных строк. Разность множеств считается одним запросом
+        """
+        windows = [(week.date_start, week.date_end) for week in weeks if week.date_start and week.date_end]
+        if not windows:
+            return 0
+
+        cursor.execute("""
+            DELETE FROM schedule s
+            USING unnest(%s::date[], %s::date[]) AS w(date_start, date_end)
+            WHERE s.group_id = %s
+              AND s.date BETWEEN w.date_start AND w.date_end
+              AND NOT EXISTS (
+                  SELECT 1
+                  FROM unnest(%s::date[], %s::time[], %s::time[], %s::text[])
+                       AS f(date, start_time, end_time, subject)
+                  WHERE f.date = s.date
+                    AND f.start_time IS NOT DISTINCT FROM s.start_time
+                    AND f.end_time IS NOT DISTINCT FROM s.end_time
+                    AND f.subject = s.subject
+              )
+        """, (
+            [start for start, _ in windows],
+            [end for _, end in windows],
+            group_id,
+            [row[1] for row in rows],
+            [row[5] for row in rows],
+            [row[6] for row in rows],
+            [row[3] for row in rows],
+        ))
+        return cursor.rowcount
+
+    def __link_resources(self, cursor, rows: List[tuple], group_id: int):
+        """
+        Добавляет преподавателей и аудитории записанных занятий в справочники
+        и проставляет занятиям teacher_id и room_id
+        """
+        teachers = sorted({row[7] for row in rows if row[7]})
+        rooms = sorted({(row[9] or '', row[8]) for row in rows if row[8]})
+        dates = sorted({row[1] for row in rows})
+
+        if teachers:
+            cursor.execute("""
+                INSERT INTO teachers (full_name) SELECT unnest(%s::text[])
+                ON CONFLICT (full_name) DO NOTHING
+            """, (teachers,))
+            cursor.execute("""
+                UPDATE schedule s SET teacher_id = t.id
+                FROM teachers t
+                WHERE s.group_id = %s AND s.date = ANY(%s::date[])
+                  AND t.full_name = s.teacher AND s.teacher_id IS DISTINCT FROM t.id
+            """, (group_id, dates))
+
+        if rooms:
+            cursor.execute("""
+                INSERT INTO rooms (building, name) SELECT * FROM unnest(%s::text[], %s::text[])
+                ON CONFLICT (building, name) DO NOTHING
+            """, ([building for building, _ in rooms], [name for _, name in rooms]))
+            cursor.execute("""
+                UPDATE schedule s SET room_id = r.id
+                FROM rooms r
+                WHERE s.group_id = %s AND s.date = ANY(%s::date[])
+                  AND r.building = COALESCE(s.place, '') AND r.name = s.audithory
+                  AND s.room_id IS DISTINCT FROM r.id
+            """, (group_id, dates))
+
+    def __add_week_stats(self, week_stats: dict):
+        with self.stats_lock:
+            for key, value in week_stats.items():
+                self.week_stats[key] += value
 
     def insert_semester_schedule(self, semester_schedule: SemesterSchedule, group_id: int):
         """
         Вставляет или обновляет расписание на весь семестр в базу данных
+        одним многострочным UPSERT на группу. Недели, хеш которых не изменился
+        с прошлой записи, пропускаются. В режиме reconcile занятия, исчезнувшие
+        из измененных недель, удаляются. Возвращает число записанных занятий
+        или None при ошибке записи
         """
         if not self.ensure_connection():
             print(f"❌ Не удалось подключиться к БД для группы {group_id}")
-            return 0
+            return None
 
         if not semester_schedule.weeks:
             print(f"⚠️ Для группы {group_id} нет данных за семестр")
             return 0
 
+        # xmax = 0 только у только что вставленных строк, у обновленных он отличен от нуля
         upsert_sql = """
         INSERT INTO schedule
         (group_id, date, weekday, subject, type, start_time, end_time, teacher, audithory, place)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        VALUES %s
         ON CONFLICT (group_id, date, start_time, end_time, subject)
         DO UPDATE SET
             weekday = EXCLUDED.weekday,
             type = EXCLUDED.type,
             teacher = EXCLUDED.teacher,
             audithory = EXCLUDED.audithory,
-            place = EXCLUDED.place
+            place = EXCLUDED.place,
+            teacher_id = CASE WHEN schedule.teacher = EXCLUDED.teacher THEN schedule.teacher_id END,
+            room_id = CASE WHEN schedule.audithory = EXCLUDED.audithory
+                            AND schedule.place IS NOT DISTINCT FROM EXCLUDED.place
+                           THEN schedule.room_id END
+        RETURNING (xmax = 0)
         """
 
+        fingerprint_sql = """
+        INSERT INTO schedule_week_fingerprints (group_id, week_start, fingerprint, updated_at)
+        VALUES %s
+        ON CONFLICT (group_id, week_start)
+        DO UPDATE SET
+            fingerprint = EXCLUDED.fingerprint,
+            updated_at = EXCLUDED.updated_at
+        """
+
+        fingerprints = {week.date_start: week.fingerprint() for week in semester_schedule.weeks}
+
         for attempt in range(self.max_retries):
             try:
-                with self.connection.cursor() as cursor:
-                    inserted_count = 0
-                    updated_count = 0
-                    batch_count = 0
-
+                with self.get_connection() as connection, connection.cursor() as cursor:
+                    cursor.execute("""
+                        SELECT week_start::text, fingerprint FROM schedule_week_fingerprints
+                        WHERE group_id = %s AND week_start = ANY(%s::date[])
+                    """, (group_id, list(fingerprints)))
+                    stored = dict(cursor.fetchall())
+
+                    week_stats = {'skipped': 0, 'changed': 0, 'new': 0, 'stale_lessons': 0}
+                    changed_weeks = []
+                    # Недели, содержимое которых изменилось (не новые): сигнал для планировщика обновлений
+                    modified_weeks = []
                     for week in semester_schedule.weeks:
-                        for day in week.days:
-                            for lesson in day.lessons:
-                                building = getattr(lesson, 'building', '') or ''
-
-                                # Проверяем, существует ли уже такое занятие
-                                cursor.execute("""
-                                    SELECT COUNT(*) FROM schedule
-                                    WHERE group_id = %s AND date = %s AND start_time = %s AND end_time = %s AND subject = %s
-                                """, (
-                                    group_id,
-                                    day.date,
-                                    lesson.time_start,
-                                    lesson.time_end,
-                                    lesson.subject
-                                ))
-                                exists = cursor.fetchone()[0] > 0
-
-                                # Выполняем UPSERT
-                                cursor.execute(upsert_sql, (
-                                    group_id,
-                                    day.date,
-                                    day.weekday,
-                                    lesson.subject,
-                                    lesson.type,
-                                    lesson.time_start,
-                                    lesson.time_end,
-                                    lesson.teacher,
-                                    lesson.auditory,
-                                    building
-                                ))
-
-                                if exists:
-                                    updated_count += 1
-                                else:
-                                    inserted_count += 1
-
-                                batch_count += 1
-
-                                # Коммитим каждые 50 записей
-                                if batch_count >= 50:
-                                    self.connection.commit()
-                                    batch_count = 0
-                                    if not self.ensure_connection():
-                                        return inserted_count + updated_count
-
-                    # Финальный коммит
-                    self.connection.commit()
+                        stored_fingerprint = stored.get(week.date_start)
+                        if stored_fingerprint is None:
+                            week_stats['new'] += 1
+                            changed_weeks.append(week)
+                        elif stored_fingerprint != fingerprints[week.date_start]:
+                            week_stats['changed'] += 1
+                            changed_weeks.append(week)
+                            modified_weeks.append(week)
+                        else:
+                            week_stats['skipped'] += 1
+
+                    if not changed_weeks:
+                        connection.rollback()
+                        self.__add_week_stats(week_stats)
+                        return 0
+
+                    rows = self.__schedule_rows(changed_weeks, group_id)
+                    if self.reconcile:
+                        week_stats['stale_lessons'] = self.__delete_stale_lessons(cursor, changed_weeks,
+                                                                                  rows, group_id)
+
+                    results = []
+                    if rows:
+                        results = execute_values(cursor, upsert_sql, rows, page_size=self.batch_size, fetch=True)
+                        self.__link_resources(cursor, rows, group_id)
+
+                    now = datetime.now()
+                    execute_values(cursor, fingerprint_sql, [
+                        (group_id, week.date_start, fingerprints[week.date_start], now)
+                        for week in changed_weeks
+                    ])
+                    self.__mark_conflict_days(cursor, group_id, sorted({
+                        date.fromisoformat(week.date_start) + timedelta(days=offset)
+                        for week in changed_weeks if week.date_start
+                        for offset in range(7)
+                    }))
+                    if modified_weeks:
+                        execute_values(cursor, """
+                            INSERT INTO schedule_week_changes (group_id, week_start, changed_at) VALUES %s
+                        """, [(group_id, week.date_start, now) for week in modified_weeks])
+                    connection.commit()
+                    self.__add_week_stats(week_stats)
+
+                    inserted_count = sum(1 for (inserted,) in results if inserted)
+                    updated_count = len(results) - inserted_count
                     return inserted_count + updated_count
 
             except (OperationalError, InterfaceError) as e:
@@ -272,63 +539,15 @@ class DatabaseManager:
                         continue
                 else:
                     print(f"💥 Все попытки для группы {group_id} не удались")
-                    return 0
+                    return None
             except Exception as e:
                 print(f"💥 Неожиданная ошибка для группы {group_id}: {e}")
-                self.connection.rollback()
-                return 0
-
-        return 0
-
-    def create_unique_constraints(self):
-        """Создает уникальные ограничения в таблицах для предотвращения дубликатов"""
-        if not self.ensure_connection():
-            print("Не удалось подключиться для создания ограничений")
-            return False
+                return None
 
-        try:
-            with self.connection.cursor() as cursor:
-                # Создаем уникальное ограничение для calendar_events
-                cursor.execute("""
-                    DO $$
-                    BEGIN
-                        IF NOT EXISTS (
-                            SELECT 1 FROM pg_constraint
-                            WHERE conname = 'unique_calendar_event'
-                        ) THEN
-                            ALTER TABLE calendar_events
-                            ADD CONSTRAINT unique_calendar_event
-                            UNIQUE (title, date, start_time, end_time, calendar_name);
-                        END IF;
-                    END $$;
-                """)
-
-                # Создаем уникальное ограничение для schedule
-                cursor.execute("""
-                    DO $$
-                    BEGIN
-                        IF NOT EXISTS (
-                            SELECT 1 FROM pg_constraint
-                            WHERE conname = 'unique_schedule_lesson'
-                        ) THEN
-                            ALTER TABLE schedule
-                            ADD CONSTRAINT unique_schedule_lesson
-                            UNIQUE (group_id, date, start_time, end_time, subject);
-                        END IF;
-                    END $$;
-                """)
-
-                self.connection.commit()
-                print("Уникальные ограничения созданы или уже существуют")
-                return True
-
-        except Exception as e:
-            print(f"Ошибка создания уникальных ограничений: {e}")
-            self.connection.rollback()
-            return False
+        return None
 
     def cleanup_duplicate_schedule_entries(self):
-        """Очищает дубликаты в таблице расписания (на всякий случай)"""
+        """Очищает дубликаты в таблице расписания (разовое обслуживание, запуск с --dedupe)"""
         if not self.ensure_connection():
             print("Не удалось подключиться для очистки дубликатов")
             return
@@ -348,27 +567,18 @@ class DatabaseManager:
         """
 
         try:
-            with self.connection.cursor() as cursor:
-                cursor.execute("SELECT COUNT(*) FROM schedule")
-                before_count = cursor.fetchone()[0]
-
+            with self.get_connection() as connection, connection.cursor() as cursor:
                 cursor.execute(cleanup_sql)
                 deleted_count = cursor.rowcount
-
-                self.connection.commit()
-
-                cursor.execute("SELECT COUNT(*) FROM schedule")
-                after_count = cursor.fetchone()[0]
+                connection.commit()
 
                 print(f"Очистка дубликатов расписания: удалено {deleted_count} записей")
-                print(f"Было: {before_count}, стало: {after_count} записей")
 
         except Exception as e:
             print(f"Ошибка очистки дубликатов расписания: {e}")
-            self.connection.rollback()
 
     def cleanup_duplicate_calendar_events(self):
-        """Очищает дубликаты в таблице событий календаря (на всякий случай)"""
+        """Очищает дубликаты в таблице событий календаря (разовое обслуживание, запуск с --dedupe)"""
         if not self.ensure_connection():
             print("Не удалось подключиться для очистки дубликатов календаря")
             return
@@ -388,24 +598,15 @@ class DatabaseManager:
         """
 
         try:
-            with self.connection.cursor() as cursor:
-                cursor.execute("SELECT COUNT(*) FROM calendar_events")
-                before_count = cursor.fetchone()[0]
-
+            with self.get_connection() as connection, connection.cursor() as cursor:
                 cursor.execute(cleanup_sql)
                 deleted_count = cursor.rowcount
-
-                self.connection.commit()
-
-                cursor.execute("SELECT COUNT(*) FROM calendar_events")
-                after_count = cursor.fetchone()[0]
+                connection.commit()
 
                 print(f"Очистка дубликатов календаря: удалено {deleted_count} записей")
-                print(f"Было: {before_count}, стало: {after_count} записей")
 
         except Exception as e:
             print(f"Ошибка очистки дубликатов календаря: {e}")
-            self.connection.rollback()
 
     def insert_faculties_and_groups(self, scheduler_parser: SchedulerParser):
         if not self.ensure_connection():
@@ -420,7 +621,7 @@ class DatabaseManager:
             ON CONFLICT (id) DO UPDATE SET name = EXCLUDED.name, abbr = EXCLUDED.abbr
             """
 
-            with self.connection.cursor() as cursor:
+            with self.get_connection() as connection, connection.cursor() as cursor:
                 for faculty in faculties:
                     cursor.execute(faculty_sql, (faculty.id, faculty.name, faculty.abbr))
 
@@ -439,18 +640,17 @@ class DatabaseManager:
                             cursor.execute(group_sql, (group.id, group.name, faculty.id))
                         print(f"Факультет {faculty.name}: {len(groups)} групп")
 
-                        self.connection.commit()
+                        connection.commit()
 
                     except Exception as e:
                         print(f"Ошибка получения групп для факультета {faculty.name}: {e}")
-                        self.connection.rollback()
+                        connection.rollback()
 
                 print(f"Вставлено {len(faculties)} факультетов и {len(all_groups)} групп в Supabase")
                 return all_groups
 
         except Exception as e:
             print(f"Ошибка вставки факультетов и групп: {e}")
-            self.connection.rollback()
             return []
 
     def get_all_group_ids(self):
@@ -459,7 +659,7 @@ class DatabaseManager:
             return []
 
         try:
-            with self.connection.cursor() as cursor:
+            with self.get_connection() as connection, connection.cursor() as cursor:
                 cursor.execute("SELECT id FROM groups ORDER BY id")
                 group_ids = [row[0] for row in cursor.fetchall()]
                 return group_ids
@@ -476,7 +676,7 @@ class DatabaseManager:
         missing_tables = []
 
         try:
-            with self.connection.cursor() as cursor:
+            with self.get_connection() as connection, connection.cursor() as cursor:
                 for table in tables:
                     cursor.execute("""
                         SELECT EXISTS (
@@ -529,10 +729,12 @@ def verify_connection():
 
 
 def get_all_groups_semester_schedule(scheduler_parser: SchedulerParser, db_manager: DatabaseManager,
-                                     max_groups: int = None, delay: float = 5.0):
+                                     max_groups: int = None, max_workers: int = 8,
+                                     ledger: SyncLedger = None, resume: bool = False, only_failed: bool = False,
+                                     group_ids: List[int] = None, refresh_scheduler: RefreshScheduler = None):
     print("Получаем расписание с ТЕКУЩЕЙ ДАТЫ для всех групп...")
 
-    all_group_ids = db_manager.get_all_group_ids()
+    all_group_ids = group_ids if group_ids is not None else db_manager.get_all_group_ids()
 
     if not all_group_ids:
         print("Не найдено групп в базе данных")
@@ -541,6 +743,14 @@ def get_all_groups_semester_schedule(scheduler_parser: SchedulerParser, db_manag
     if max_groups:
         all_group_ids = all_group_ids[:max_groups]
 
+    # Журнал прохода: новый проход или продолжение прерванного
+    if ledger:
+        if resume or only_failed:
+            all_group_ids = ledger.pending_groups(all_group_ids, only_failed=only_failed)
+            print(f"Продолжаем проход: осталось {len(all_group_ids)} групп")
+        else:
+            ledger.start(all_group_ids)
+
     print(f"Всего групп для обработки: {len(all_group_ids)}")
 
     total_lessons = 0
@@ -551,55 +761,73 @@ def get_all_groups_semester_schedule(scheduler_parser: SchedulerParser, db_manag
     # Используем текущую дату
     current_date = datetime.now().strftime('%Y-%m-%d')
 
-    for i, group_id in enumerate(all_group_ids, 1):
+    def on_result(i: int, result: CrawlResult):
+        nonlocal total_lessons, successful_groups, failed_groups, total_weeks
+        group_id = result.group_id
+        semester_schedule = result.semester_schedule
+
         try:
-            # Получаем расписание с ТЕКУЩЕЙ ДАТЫ
-            semester_schedule = scheduler_parser.get_semester_schedule(
-                group_id=group_id,
-                start_date=current_date,
-                max_weeks=6
-            )
+            if result.error:
+                raise result.error
 
             if semester_schedule.weeks:
                 lessons_count = db_manager.insert_semester_schedule(semester_schedule, group_id)
 
+                if lessons_count is None:
+                    raise RuntimeError("не удалось записать расписание в БД")
+
                 if lessons_count > 0:
                     successful_groups += 1
                     total_lessons += lessons_count
                     total_weeks += len(semester_schedule.weeks)
 
-                    # Подсчитываем общее количество занятий
-                    total_semester_lessons = sum(
-                        len(day.lessons) for week in semester_schedule.weeks for day in week.days)
-
                     print(f"✅ Группа {i}/{len(all_group_ids)} (ID: {group_id}): {lessons_count} занятий за {len(semester_schedule.weeks)} недель")
                 else:
                     print(f"○ Группа {i}/{len(all_group_ids)} (ID: {group_id}): нет новых занятий")
             else:
                 print(f"○ Группа {i}/{len(all_group_ids)} (ID: {group_id}): нет данных")
 
+            # Сюда доходят только группы, все недели которых получены (пусть и пустыми):
+            # ошибка загрузки любой недели приходит в result.error
+            if ledger:
+                ledger.mark_done(group_id, semester_schedule.fingerprint())
+            if refresh_scheduler:
+                # Время обновления - когда неделя получена от RUZ, а не время записи:
+                # расписание из кеша не делает группу свежее момента загрузки в кеш
+                refresh_scheduler.mark_refreshed(group_id, semester_schedule.fetched_at)
+
         except Exception as e:
             failed_groups += 1
             print(f"❌ Группа {i}/{len(all_group_ids)} (ID: {group_id}): ошибка - {e}")
+            if ledger:
+                ledger.mark_failed(group_id, str(e))
 
-        if i < len(all_group_ids):
-            current_delay = random.uniform(3.0, 5.0)
-            time.sleep(current_delay)
-
-        if i % 20 == 0:
-            db_manager.ensure_connection()
+    # Получаем расписания параллельно, запись в БД идет в текущем потоке
+    crawler = ScheduleCrawler(scheduler_parser, max_workers=max_workers)
+    crawler.crawl(all_group_ids, start_date=current_date, max_weeks=6, on_result=on_result)
 
     print(f"\n🎯 ФИНАЛЬНАЯ СТАТИСТИКА:")
     print(f"   ✅ Успешно обработано: {successful_groups} групп")
     print(f"   ❌ С ошибками: {failed_groups} групп")
     print(f"   📅 Всего недель расписания: {total_weeks}")
     print(f"   📚 Всего занятий записано в БД: {total_lessons}")
-
-def main():
-    calendar_parser = GoogleCalendarParser()
-    scheduler_parser = SchedulerParser()
+    print(f"   ⏭️ Недель без изменений (пропущено): {db_manager.week_stats['skipped']}")
+    print(f"   ✏️ Недель изменено: {db_manager.week_stats['changed']}")
+    print(f"   🆕 Новых недель: {db_manager.week_stats['new']}")
+    print(f"   🗑️ Удалено устаревших занятий: {db_manager.week_stats['stale_lessons']}")
+
+def main(resume: bool = False, only_failed: bool = False,
+         metrics_json: str = 'sync_metrics.json', metrics_prom: str = None, reconcile: bool = True,
+         prioritized: bool = False, budget: int = None):
+    calendar_parser = GoogleCalendarParser(sync_state=CalendarSyncState())
+    # Общий ограничитель частоты запросов к RUZ для всех потоков
+    scheduler_parser = SchedulerParser(
+        rate_limiter=AdaptiveRateLimiter(rate=5.0, max_rate=30.0),
+        response_cache=SQLiteResponseCache()
+    )
 
     db_manager = DatabaseManager()
+    db_manager.reconcile = reconcile
 
     try:
         if not db_manager.connect():
@@ -613,52 +841,75 @@ def main():
         print("НАЧИНАЕМ СБОР ДАННЫХ В SUPABASE...")
         print("=" * 50)
 
-        # ДОБАВЛЯЕМ ПОЛЕ place В ТАБЛИЦУ schedule
-        print("Добавляем поле place в таблицу schedule...")
-        if not db_manager.add_place_column_to_schedule():
-            print("Не удалось добавить поле place. Продолжаем без него...")
-
-        print("Создание уникальных ограничений для предотвращения дубликатов...")
-        db_manager.create_unique_constraints()
-
-        print("Очистка существующих дубликатов...")
-        db_manager.cleanup_duplicate_calendar_events()
-        db_manager.cleanup_duplicate_schedule_entries()
+        # Поля, индексы и уникальные ограничения создаются миграциями один раз,
+        # полная очистка дубликатов выполняется отдельно (--dedupe)
+        print("Проверяем миграции схемы...")
+        if not MigrationManager(db_manager).migrate():
+            print("Не удалось применить миграции схемы")
+            return
 
         print("\nПолучаем события из Google Calendar...")
-        today = datetime.now()
-        first_day = today.replace(day=1)
-        if today.month == 12:
-            last_day = today.replace(year=today.year + 1, month=1, day=1) - timedelta(days=1)
-        else:
-            last_day = today.replace(month=today.month + 1, day=1) - timedelta(days=1)
-
-        time_min = first_day.strftime('%Y-%m-%dT00:00:00Z')
-        time_max = last_day.strftime('%Y-%m-%dT23:59:59Z')
-
-        calendar_events = []
-        for calendar in calendar_parser.CALENDARS:
-            events = calendar_parser.getEvents(
-                calendar_id=calendar['id'],
-                calendar_name=calendar['name'],
-                time_min=time_min,
-                time_max=time_max
-            )
-            calendar_events.extend(events)
-            print(f"{calendar['name']}: {len(events)} событий")
-
-        db_manager.insert_calendar_events(calendar_events)
+        # Границы месяца - полночь в часовом поясе, в котором события хранятся в БД,
+        # иначе первые часы 1-го числа выпадают из запроса и из очистки полной загрузки
+        today = datetime.now(calendar_parser.timezone)
+        first_day = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        next_month_day = (first_day + timedelta(days=32)).replace(day=1)
+
+        # timeMax в Google Calendar API не включается в период
+        time_min = first_day.isoformat()
+        time_max = next_month_day.isoformat()
+
+        # Загружаются только изменения с прошлого запуска, состояние сохраняется после записи в БД
+        # Изменения каждого календаря записываются сразу после его загрузки
+        with metrics.timer('stage_seconds', stage='calendar'):
+            for calendar, calendar_changes in calendar_parser.iterAllEventChanges(time_min=time_min,
+                                                                                  time_max=time_max):
+                if db_manager.apply_calendar_changes(calendar_changes):
+                    calendar_parser.sync_state.commit(calendar['id'])
+            calendar_parser.sync_state.save()
 
         print("\nПолучаем факультеты и группы из СПбПУ...")
-        all_groups = db_manager.insert_faculties_and_groups(scheduler_parser)
+        with metrics.timer('stage_seconds', stage='faculties_and_groups'):
+            all_groups = db_manager.insert_faculties_and_groups(scheduler_parser)
+
+        if all_groups and prioritized:
+            # Обновляются только группы, у которых истекает SLA свежести их уровня
+            refresh_scheduler = RefreshScheduler(db_manager)
+            # SLA горячего уровня короче TTL кеша RUZ: ответы перепроверяются условными
+            # запросами, чтобы группа обновлялась по ответу RUZ (200 или 304), а не по кешу
+            scheduler_parser.revalidate = True
+            with metrics.timer('stage_seconds', stage='schedule'):
+                get_all_groups_semester_schedule(scheduler_parser, db_manager,
+                                                 group_ids=refresh_scheduler.due_groups(budget),
+                                                 refresh_scheduler=refresh_scheduler)
+        elif all_groups:
+            ledger = SyncLedger()
+            try:
+                with metrics.timer('stage_seconds', stage='schedule'):
+                    # Полный проход читает свежий кеш; время обновления групп отмечается
+                    # по времени загрузки ответов, так что --prioritized не повторит весь обход
+                    get_all_groups_semester_schedule(scheduler_parser, db_manager, ledger=ledger,
+                                                     resume=resume, only_failed=only_failed,
+                                                     refresh_scheduler=RefreshScheduler(db_manager))
+            finally:
+                ledger.close()
+
+        # Пересечения занятий с событиями только для дней, затронутых этим запуском
+        print("\nПересчитываем пересечения занятий с событиями...")
+        with metrics.timer('stage_seconds', stage='conflicts'):
+            ConflictEngine(db_manager).refresh()
 
-        if all_groups:
-            get_all_groups_semester_schedule(scheduler_parser, db_manager)
+        # Готовые снимки недель и месяцев для чтения клиентами (ReadModel.py)
+        print("\nОбновляем снимки для чтения...")
+        with metrics.timer('stage_seconds', stage='snapshots'):
+            snapshot_builder = SnapshotBuilder(db_manager)
+            snapshot_builder.build_schedule_snapshots()
+            snapshot_builder.build_calendar_snapshots(first_day.date())
 
         print("\nВСЕ ДАННЫЕ УСПЕШНО ЗАГРУЖЕНЫ В SUPABASE!")
 
         if db_manager.ensure_connection():
-            with db_manager.connection.cursor() as cursor:
+            with db_manager.get_connection() as connection, connection.cursor() as cursor:
                 cursor.execute("SELECT COUNT(*) FROM calendar_events")
                 calendar_count = cursor.fetchone()[0]
 
@@ -685,8 +936,57 @@ def main():
         print(f"Критическая ошибка: {e}")
     finally:
         db_manager.disconnect()
+        # Времена обращений к кешу ответов RUZ, накопленные в памяти
+        scheduler_parser.response_cache.flush()
+
+        # Выгружаем метрики запуска
+        if metrics_json:
+            metrics.write_json(metrics_json)
+            print(f"Метрики запуска сохранены в {metrics_json}")
+        if metrics_prom:
+            metrics.write_prometheus(metrics_prom)
+            print(f"Метрики в формате Prometheus сохранены в {metrics_prom}")
+
+
+def dedupe():
+    """Разовая полная очистка дубликатов в schedule и calendar_events"""
+    db_manager = DatabaseManager()
+    try:
+        if not db_manager.connect():
+            print("Не удалось подключиться к базе данных")
+            return
+
+        print("Очистка существующих дубликатов...")
+        db_manager.cleanup_duplicate_calendar_events()
+        db_manager.cleanup_duplicate_schedule_entries()
+    finally:
+        db_manager.disconnect()
 
 
 if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Загрузка расписания и событий в Supabase")
+    arg_parser.add_argument('--resume', action='store_true',
+                            help="продолжить прерванный проход с необработанных групп")
+    arg_parser.add_argument('--only-failed', action='store_true',
+                            help="повторить только группы, завершившиеся ошибкой")
+    arg_parser.add_argument('--metrics-json', default='sync_metrics.json',
+                            help="файл JSON-сводки метрик запуска")
+    arg_parser.add_argument('--metrics-prom',
+                            help="файл метрик в текстовом формате Prometheus")
+    arg_parser.add_argument('--prioritized', action='store_true',
+                            help="обновить только группы с истекающим SLA свежести, по приоритету")
+    arg_parser.add_argument('--budget', type=int,
+                            help="максимум групп за проход в режиме --prioritized")
+    arg_parser.add_argument('--no-reconcile', action='store_true',
+                            help="не удалять занятия, исчезнувшие из расписания RUZ")
+    arg_parser.add_argument('--dedupe', action='store_true',
+                            help="только очистить дубликаты в таблицах (разовое обслуживание)")
+    args = arg_parser.parse_args()
+
     verify_connection()
-    main()
\ No newline at end of file
+    if args.dedupe:
+        dedupe()
+    else:
+        main(resume=args.resume, only_failed=args.only_failed,
+             metrics_json=args.metrics_json, metrics_prom=args.metrics_prom,
+             reconcile=not args.no_reconcile, prioritized=args.prioritized, budget=args.budget)
\ No newline at end of file